@@ -1,5 +1,5 @@
 import dspy
-from typing import List, Optional
+from typing import Any, AsyncIterator, List, Optional, Union
 from tools_agents_selection import (
     GivenTaskAndContext,
     SelectToolsAndAgentsSignature,
@@ -15,8 +15,25 @@ from utils import (
     create_content_for_agents_execution_response,
     create_content_for_tools_operation_response,
 )
+import json
 import asyncio
-from trajectory import State
+import logging
+from trajectory import State, current_state
+from llm import apredict, astream_predict
+from llm_stream import StreamChunk
+from tool_cache import get_tool_cache
+from prompt_budget import get_prompt_budgeter
+from deadline import describe_error, with_deadline
+from tracing import get_tracer
+
+
+logger = logging.getLogger(__name__)
+
+
+def _response_or_error(node_response: Union[ToolResponse, AgentResponse]) -> Any:
+    if node_response.error is not None:
+        return f"No response, it failed with {node_response.error}"
+    return node_response.response
 
 
 class Action(dspy.Module):
@@ -32,9 +49,18 @@ class Action(dspy.Module):
         self._generate_task_response = dspy.TypedChainOfThought(
             GenerateTaskResponseSignature
         )
-        self.state = None
 
-    async def run_tool(self, tool: ToolWithArgsValues) -> ToolResponse:
+    @property
+    def state(self) -> Optional[State]:
+        """State of the last forward call made in the current task/context."""
+        return current_state.get()
+
+    async def run_tool(
+        self, tool: ToolWithArgsValues, timeout: Optional[float] = None
+    ) -> ToolResponse:
+        """Run the tool within 'timeout' and the current deadline. A failure or timeout is returned
+        as the 'error' of the ToolResponse, so the sibling tools keep their results.
+        """
         tool_name = tool.tool_name
         tool_args = tool.argument_values
 
@@ -42,9 +68,23 @@ class Action(dspy.Module):
             raise KeyError(
                 f"{tool_name} has to be present in {self.preproessed_fields.tools_mapping}"
             )
-        response = await self.preproessed_fields.tools_mapping[tool_name]._arun(
-            **tool_args
-        )
+        with get_tracer().span(
+            f"tool.{tool_name}",
+            "tool",
+            input_bytes=len(json.dumps(tool_args, default=str)),
+        ) as span:
+            try:
+                response = await with_deadline(
+                    get_tool_cache().arun(
+                        self.preproessed_fields.tools_mapping[tool_name], **tool_args
+                    ),
+                    timeout=timeout,
+                )
+            except Exception as e:
+                logger.warning(f"Tool {tool_name} failed: {describe_error(e)}")
+                span.error = describe_error(e)
+                return ToolResponse(tool=tool, error=describe_error(e))
+            span.set(output_bytes=len(str(response)))
 
         return ToolResponse(tool=tool, response=response)
 
@@ -55,11 +95,23 @@ class Action(dspy.Module):
         # values = await asyncio.gather(*output_response.values())
 
         responses = await asyncio.gather(
-            *[self.run_tool(tool) for tool in tools_to_run]
+            *[self.run_tool(tool) for tool in tools_to_run], return_exceptions=True
         )
-        return responses
+        return [
+            (
+                ToolResponse(tool=tool, error=describe_error(response))
+                if isinstance(response, BaseException)
+                else response
+            )
+            for tool, response in zip(tools_to_run, responses)
+        ]
 
-    async def execute_agent(self, agent: AgentWithArgsValues) -> AgentResponse:
+    async def execute_agent(
+        self, agent: AgentWithArgsValues, timeout: Optional[float] = None
+    ) -> AgentResponse:
+        """Execute the team agent within 'timeout' and the current deadline, errors are returned
+        as the 'error' of the AgentResponse.
+        """
         agent_name = agent.agent_name
         agent_args = agent.argument_values
         if agent_name not in self.preproessed_fields.agents_mapping:
@@ -67,9 +119,16 @@ class Action(dspy.Module):
                 f"{agent_name} has to be present in {self.preproessed_fields.agents_mapping}"
             )
 
-        response = await self.preproessed_fields.agents_mapping[agent_name].forward(
-            **agent_args
-        )
+        try:
+            response = await with_deadline(
+                self.preproessed_fields.agents_mapping[agent_name].forward(
+                    **agent_args
+                ),
+                timeout=timeout,
+            )
+        except Exception as e:
+            logger.warning(f"Agent {agent_name} failed: {describe_error(e)}")
+            return AgentResponse(agent=agent, error=describe_error(e))
 
         return AgentResponse(agent=agent, response=response)
 
@@ -82,14 +141,23 @@ class Action(dspy.Module):
         # values = await asyncio.gather(*output_response.values())
         # return dict(zip(output_response.keys(), values))
         responses = await asyncio.gather(
-            *[self.execute_agent(agent) for agent in agents_to_execute]
+            *[self.execute_agent(agent) for agent in agents_to_execute],
+            return_exceptions=True,
         )
-        return responses
+        return [
+            (
+                AgentResponse(agent=agent, error=describe_error(response))
+                if isinstance(response, BaseException)
+                else response
+            )
+            for agent, response in zip(agents_to_execute, responses)
+        ]
 
     async def select_right_tools_and_agents(
         self, task: GivenTaskAndContext
     ) -> SelectedToolsAndAgents:
-        response = self._select_tools_and_agents(
+        response = await apredict(
+            self._select_tools_and_agents,
             task_context=task,
             available_tools_and_agents=self.preproessed_fields.tools_and_agents_args_type_formats,
         )
@@ -98,52 +166,104 @@ class Action(dspy.Module):
         else:
             return ValueError("The response doesn't contain selected_tools_and_agents")
 
-    async def generate_task_response(
+    def task_response_inputs(
         self,
         task: GivenTaskAndContext,
         tools_operation_response: List[ToolResponse],
         agents_execution_response: List[AgentResponse],
-    ) -> str:
-
-        response = self._generate_task_response(
+    ) -> dict:
+        """Inputs of the task response prompt, tool and agent responses fitted in the prompt budget."""
+        tool_texts, agent_texts = get_prompt_budgeter().fit(
+            [
+                _response_or_error(tool_response)
+                for tool_response in tools_operation_response
+            ],
+            [
+                _response_or_error(agent_response)
+                for agent_response in agents_execution_response
+            ],
+        )
+        return dict(
             task=task,
             tools_operation_response=create_content_for_tools_operation_response(
-                tools_operation_response
+                tools_operation_response, rendered_responses=tool_texts
             ),
             agents_execution_response=create_content_for_agents_execution_response(
-                agents_execution_response
+                agents_execution_response, rendered_responses=agent_texts
+            ),
+        )
+
+    async def generate_task_response(
+        self,
+        task: GivenTaskAndContext,
+        tools_operation_response: List[ToolResponse],
+        agents_execution_response: List[AgentResponse],
+    ) -> str:
+
+        response = await apredict(
+            self._generate_task_response,
+            **self.task_response_inputs(
+                task, tools_operation_response, agents_execution_response
             ),
         )
 
         return response.final_response
 
-    async def forward(self, task: GivenTaskAndContext) -> str:
+    async def astream_task_response(
+        self,
+        task: GivenTaskAndContext,
+        tools_operation_response: List[ToolResponse],
+        agents_execution_response: List[AgentResponse],
+    ) -> AsyncIterator[Union[StreamChunk, str]]:
+        """'generate_task_response' yielding the partial final_response while it is generated,
+        then the final response.
+        """
+        async for item in astream_predict(
+            self._generate_task_response,
+            field="final_response",
+            **self.task_response_inputs(
+                task, tools_operation_response, agents_execution_response
+            ),
+        ):
+            yield item if isinstance(item, StreamChunk) else item.final_response
 
-        self.state = State(task=task)  # initializing state
+    async def execute(self, task: GivenTaskAndContext) -> State:
+        """Run the task and return its own State. Nothing is stored on the instance."""
+        with get_tracer().span("action.execute", "action") as span:
+            state = State(task=task, span_id=span.span_id)  # initializing state
 
-        selected_tools_and_agents_response = await self.select_right_tools_and_agents(
-            task=task
-        )
+            with get_tracer().span("action.select_tools_and_agents", "action"):
+                selected_tools_and_agents_response = (
+                    await self.select_right_tools_and_agents(task=task)
+                )
+            state.selected_tools_and_agents = selected_tools_and_agents_response
 
-        tools_to_run, agents_to_execute = (
-            selected_tools_and_agents_response.tools_to_run,
-            selected_tools_and_agents_response.agents_to_execute,
-        )
-        # print(f"Selected tools :{tools_to_run} | Agents :{agents_to_execute}")
+            tools_to_run, agents_to_execute = (
+                selected_tools_and_agents_response.tools_to_run,
+                selected_tools_and_agents_response.agents_to_execute,
+            )
+            # print(f"Selected tools :{tools_to_run} | Agents :{agents_to_execute}")
+            span.set(tools=len(tools_to_run), agents=len(agents_to_execute))
 
-        tools_operation_response, agents_execution_response = await self.run_tools(
-            tools_to_run
-        ), await self.execute_agents(agents_to_execute)
+            tools_operation_response, agents_execution_response = await self.run_tools(
+                tools_to_run
+            ), await self.execute_agents(agents_to_execute)
 
-        task_response = await self.generate_task_response(
-            task=task,
-            tools_operation_response=tools_operation_response,
-            agents_execution_response=agents_execution_response,
-        )
+            with get_tracer().span("action.generate_task_response", "action"):
+                task_response = await self.generate_task_response(
+                    task=task,
+                    tools_operation_response=tools_operation_response,
+                    agents_execution_response=agents_execution_response,
+                )
 
-        # update state
-        self.state.tools_used = tools_operation_response
-        self.state.agents_interaction = agents_execution_response
-        self.state.response = task_response  # update state
+            # update state
+            state.tools_used = tools_operation_response
+            state.agents_interaction = agents_execution_response
+            state.response = task_response  # update state
 
-        return task_response
+            return state
+
+    async def forward(self, task: GivenTaskAndContext) -> str:
+        state = await self.execute(task=task)
+        current_state.set(state)
+        return state.response
@@ -0,0 +1,73 @@
+import asyncio
+import threading
+from typing import Any, Callable, Dict, Optional, Type
+from agent import Agent
+from trajectory import Trajectory, collected_trajectories
+
+
+class AgentHandle:
+    """Per request handle on a pooled agent.
+
+    Every call runs in its own task (hence its own context), so the trajectory and state of one
+    request never leak into another one served by the same agent graph.
+    """
+
+    def __init__(self, agent: Agent):
+        self.agent = agent
+        self.response: Any = None
+        self.trajectory: Optional[Trajectory] = None
+
+    async def forward(self, **kwargs) -> Any:
+        async def run():
+            collected = []
+            collected_trajectories.set(collected)
+            response = await self.agent.forward(**kwargs)
+            return response, collected[0] if collected else None
+
+        self.response, self.trajectory = await asyncio.create_task(run())
+        return self.response
+
+    __call__ = forward
+
+
+class AgentPool:
+    """Builds each agent graph once and hands out cheap per request handles on it."""
+
+    def __init__(self):
+        self._agents: Dict[Type[Agent], Agent] = {}
+        self._factories: Dict[Type[Agent], Callable[[], Agent]] = {}
+        # agents pull their team agents from the pool while being built.
+        self._lock = threading.RLock()
+
+    def register(self, agent_cls: Type[Agent], factory: Callable[[], Agent]):
+        """Use 'factory' instead of 'agent_cls()' to build the pooled agent."""
+        self._factories[agent_cls] = factory
+
+    def get(self, agent_cls: Type[Agent]) -> Agent:
+        agent = self._agents.get(agent_cls)
+        if agent is None:
+            with self._lock:
+                agent = self._agents.get(agent_cls)
+                if agent is None:
+                    agent = self._factories.get(agent_cls, agent_cls)()
+                    self._agents[agent_cls] = agent
+        return agent
+
+    def handle(self, agent_cls: Type[Agent]) -> AgentHandle:
+        return AgentHandle(self.get(agent_cls))
+
+    def warm(self, *agent_classes: Type[Agent]):
+        """Build the agent graphs ahead of the first request."""
+        for agent_cls in agent_classes:
+            self.get(agent_cls)
+
+    def clear(self):
+        with self._lock:
+            self._agents.clear()
+
+
+_agent_pool = AgentPool()
+
+
+def get_agent_pool() -> AgentPool:
+    return _agent_pool
@@ -0,0 +1,391 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import argparse
+from statistics import quantiles
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+    Union,
+)
+from pydantic import BaseModel
+from pydantic.fields import Field
+from agent import Agent
+from agent_pool import get_agent_pool
+from deadline import deadline_scope, describe_error, with_deadline
+from http_client import close_session
+from presentation_agent import PresentationAIAgent
+from runtime_config import configure_runtime
+from search_agent import SearchAgent
+from trajectory_store import to_jsonable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_AGENTS: Dict[str, Type[Agent]] = {
+    "presentation": PresentationAIAgent,
+    "search": SearchAgent,
+}
+
+
+class BatchTask(BaseModel):
+    id: Optional[str] = Field(
+        None,
+        description="Id of the task in the results, a hash of the task when not given.",
+    )
+    task: str = Field(..., description="Task given to the agent.")
+    context: Optional[str] = Field(None, description="Context of the task.")
+    agent: str = Field("presentation", description="One of BATCH_AGENTS.")
+
+    def key(self) -> str:
+        if self.id is not None:
+            return self.id
+        payload = json.dumps([self.agent, self.task, self.context])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class BatchResult(BaseModel):
+    id: str = Field(..., description="Id of the task.")
+    agent: str = Field(..., description="Agent which ran the task.")
+    response: Any = Field(None, description="Response of the agent.")
+    error: Optional[str] = Field(
+        None, description="Error of the task, None on success."
+    )
+    started_at: float = Field(..., description="Epoch seconds.")
+    duration_seconds: float = Field(..., description="Wall time of the task.")
+    trajectory_id: Optional[str] = Field(
+        None, description="Trajectory of the run, to find its log for replay."
+    )
+
+
+class BatchStats(BaseModel):
+    succeeded: int = Field(0, description="Tasks run successfully in this run.")
+    failed: int = Field(0, description="Tasks run with an error in this run.")
+    skipped: int = Field(
+        0, description="Tasks already done (or reported invalid) in the results file."
+    )
+    elapsed_seconds: float = Field(0.0, description="Wall time of the run.")
+    durations: List[float] = Field(
+        [], description="Wall time of each task run.", exclude=True
+    )
+
+    @property
+    def completed(self) -> int:
+        return self.succeeded + self.failed
+
+    @property
+    def tasks_per_hour(self) -> float:
+        return (
+            3600.0 * self.completed / self.elapsed_seconds
+            if self.elapsed_seconds
+            else 0.0
+        )
+
+    def percentile(self, percent: int) -> float:
+        if len(self.durations) < 2:
+            return self.durations[0] if self.durations else 0.0
+        return quantiles(self.durations, n=100, method="inclusive")[percent - 1]
+
+    def summary(self) -> str:
+        return (
+            f"{self.completed} tasks ({self.failed} failed, {self.skipped} skipped) in "
+            f"{self.elapsed_seconds:.1f}s: {self.tasks_per_hour:.0f} tasks/h, "
+            f"p50 {self.percentile(50):.1f}s, p95 {self.percentile(95):.1f}s"
+        )
+
+
+class InvalidTask(BaseModel):
+    """Line of a tasks file which is not a task. The batch records it as a failed result."""
+
+    line: int = Field(..., description="Line number in the tasks file.")
+    error: str = Field(..., description="Why the line is not a task.")
+
+
+def load_tasks(path: str) -> Iterator[Union[BatchTask, InvalidTask]]:
+    """Tasks of a JSON lines file, read lazily. A line is a BatchTask object or a plain string,
+    the other lines come as InvalidTask.
+    """
+    with open(path, encoding="utf-8") as file:
+        for number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                task = as_batch_task(json.loads(line))
+            except (TypeError, ValueError) as e:
+                task = InvalidTask(line=number, error=describe_error(e))
+            yield task
+
+
+def as_batch_task(task: Union[BatchTask, InvalidTask, dict, str]) -> BatchTask:
+    if isinstance(task, BatchTask):
+        return task
+    if isinstance(task, InvalidTask):
+        raise ValueError(f"line {task.line}: {task.error}")
+    if isinstance(task, str):
+        return BatchTask(task=task)
+    return BatchTask(**task)
+
+
+def invalid_task_result(task: Any, error: str) -> BatchResult:
+    """Failed result of an input which is not a runnable task (malformed, unknown agent)."""
+    if isinstance(task, InvalidTask):
+        task_id = f"line-{task.line}"
+    elif isinstance(task, (BatchTask, dict)) and _field(task, "id") is not None:
+        task_id = str(_field(task, "id"))
+    else:
+        payload = json.dumps(to_jsonable(task), sort_keys=True)
+        task_id = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+    return BatchResult(
+        id=task_id,
+        agent=str(_field(task, "agent") or "unknown"),
+        error=error,
+        started_at=time.time(),
+        duration_seconds=0.0,
+    )
+
+
+def _field(task: Any, name: str) -> Any:
+    if isinstance(task, dict):
+        return task.get(name)
+    return getattr(task, name, None)
+
+
+def open_results(path: str):
+    """Open a results file for appending. A last line cut by a crash is ended first, so that the
+    next result starts on its own line (the cut one is skipped on resume).
+    """
+    cut = False
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        with open(path, "rb") as file:
+            file.seek(-1, os.SEEK_END)
+            cut = file.read(1) != b"\n"
+    output = open(path, "a", encoding="utf-8")
+    if cut:
+        output.write("\n")
+    return output
+
+
+def _read_results(path: str) -> Iterator[dict]:
+    if not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue  # a line cut by a crash.
+
+
+def completed_task_ids(path: str) -> Set[str]:
+    """Ids of the tasks of a results file that succeeded. Failed ones are run again on resume."""
+    return {
+        result["id"] for result in _read_results(path) if result.get("error") is None
+    }
+
+
+def reported_errors(path: str) -> Set[Tuple[str, str]]:
+    """(id, error) of the failed results of a results file. An invalid input already reported
+    with the same error is not reported again on resume.
+    """
+    return {
+        (result["id"], result["error"])
+        for result in _read_results(path)
+        if result.get("error") is not None
+    }
+
+
+async def _aiter(tasks: Union[Iterable, AsyncIterable]) -> AsyncIterator:
+    if isinstance(tasks, AsyncIterable):
+        async for task in tasks:
+            yield task
+    else:
+        for task in tasks:
+            yield task
+
+
+class BatchRunner:
+    """Runs many tasks on one event loop, at most 'concurrency' at a time.
+
+    The tasks share the pooled agent graphs, the LLM/tool caches, the scheduler and the HTTP
+    connection pool of the process. Results are appended to 'output_path' (JSON lines) as the tasks
+    finish, and the file is the checkpoint: tasks it holds a successful result for are skipped, and
+    so are the invalid inputs it already reports.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = DEFAULT_BATCH_CONCURRENCY,
+        timeout: Optional[float] = None,
+        agents: Optional[Dict[str, Type[Agent]]] = None,
+    ):
+        if concurrency < 1:
+            raise ValueError(f"concurrency has to be >= 1, got {concurrency}")
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.agents = agents or BATCH_AGENTS
+        self.stats = BatchStats()
+
+    async def run_task(self, task: BatchTask) -> BatchResult:
+        started_at, start = time.time(), time.perf_counter()
+        handle = get_agent_pool().handle(self.agents[task.agent])
+        kwargs = {"task": task.task}
+        if task.context is not None:
+            kwargs["context"] = task.context
+        response, error = None, None
+        try:
+            # the deadline is seen by the whole agent tree, which returns what it has in time.
+            with deadline_scope(self.timeout):
+                response = await with_deadline(handle.forward(**kwargs))
+        except Exception as e:
+            error = describe_error(e)
+            logger.warning(f"Task {task.key()} failed: {error}")
+        return BatchResult(
+            id=task.key(),
+            agent=task.agent,
+            response=to_jsonable(response),
+            error=error,
+            started_at=started_at,
+            duration_seconds=time.perf_counter() - start,
+            trajectory_id=handle.trajectory.id if handle.trajectory else None,
+        )
+
+    async def arun(
+        self,
+        tasks: Union[Iterable, AsyncIterable],
+        output_path: Optional[str] = None,
+    ) -> AsyncIterator[BatchResult]:
+        """Yield the results in completion order. 'tasks' (BatchTask, dicts or strings) is consumed
+        lazily, as slots free up. An input which is not a runnable task (malformed, unknown agent)
+        gets a failed result and the others still run.
+        """
+        self.stats = BatchStats()
+        done = completed_task_ids(output_path) if output_path else set()
+        reported = reported_errors(output_path) if output_path else set()
+        output = open_results(output_path) if output_path else None
+        start = time.perf_counter()
+        running: Set[asyncio.Task] = set()
+        try:
+            async for item in _aiter(tasks):
+                try:
+                    task = as_batch_task(item)
+                    if task.agent not in self.agents:
+                        raise ValueError(
+                            f"unknown agent {task.agent!r} for task {task.key()}"
+                        )
+                except (TypeError, ValueError) as e:
+                    # a bad input fails on its own, the batch goes on.
+                    error = describe_error(e)
+                    result = invalid_task_result(item, error)
+                    if (result.id, result.error) in reported:
+                        self.stats.skipped += 1
+                        continue
+                    reported.add((result.id, result.error))
+                    logger.warning(f"Invalid task: {error}")
+                    for result in self._record([result], output, start, ran=False):
+                        yield result
+                    continue
+                if task.key() in done:
+                    self.stats.skipped += 1
+                    continue
+                done.add(task.key())  # duplicates of the input run once.
+                while len(running) >= self.concurrency:
+                    finished, running = await asyncio.wait(
+                        running, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for result in self._collect(finished, output, start):
+                        yield result
+                running.add(asyncio.ensure_future(self.run_task(task)))
+            while running:
+                finished, running = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED
+                )
+                for result in self._collect(finished, output, start):
+                    yield result
+        finally:
+            for pending in running:
+                pending.cancel()
+            if output is not None:
+                output.close()
+            self.stats.elapsed_seconds = time.perf_counter() - start
+
+    def _collect(self, finished, output, start: float) -> List[BatchResult]:
+        return self._record([task.result() for task in finished], output, start)
+
+    def _record(
+        self, results: List[BatchResult], output, start: float, ran: bool = True
+    ) -> List[BatchResult]:
+        """Write the results and count them. 'ran' False for inputs which never ran (no duration)."""
+        for result in results:
+            if output is not None:
+                output.write(result.model_dump_json() + "\n")
+                # flushed per result: a crash loses the running tasks only.
+                output.flush()
+            if result.error is None:
+                self.stats.succeeded += 1
+            else:
+                self.stats.failed += 1
+            if ran:
+                self.stats.durations.append(result.duration_seconds)
+        self.stats.elapsed_seconds = time.perf_counter() - start
+        if results:
+            logger.info(self.stats.summary())
+        return results
+
+    async def arun_all(
+        self,
+        tasks: Union[Iterable, AsyncIterable],
+        output_path: Optional[str] = None,
+    ) -> BatchStats:
+        async for _ in self.arun(tasks, output_path=output_path):
+            pass
+        return self.stats
+
+
+def run_batch(
+    tasks: Union[Iterable, AsyncIterable],
+    output_path: Optional[str] = None,
+    **kwargs,
+) -> BatchStats:
+    """Run the tasks on a new event loop (see BatchRunner) and return the stats."""
+    runner = BatchRunner(**kwargs)
+
+    async def main():
+        try:
+            return await runner.arun_all(tasks, output_path=output_path)
+        finally:
+            await close_session()
+
+    return asyncio.run(main())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run the tasks of a JSON lines file, resuming from the results file."
+    )
+    parser.add_argument("tasks", help="JSON lines of tasks (BatchTask or strings).")
+    parser.add_argument("results", help="JSON lines of results, appended to.")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_BATCH_CONCURRENCY)
+    parser.add_argument("--timeout", type=float, default=None, help="Per task.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    configure_runtime()
+    stats = run_batch(
+        load_tasks(args.tasks),
+        output_path=args.results,
+        concurrency=args.concurrency,
+        timeout=args.timeout,
+    )
+    print(stats.summary())
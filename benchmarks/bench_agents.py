@@ -0,0 +1,197 @@
+"""Offline end-to-end benchmark of PresentationAIAgent, with the SearchAgent and Action under it.
+
+The LLM is a ScriptedLM, Tavily and the websites are served by a local FixtureServer (see
+benchmarks/fakes.py), the caches and the document store are off and the trajectory blobs go to a
+temporary directory. Reports per deck size the throughput, p50/p95/p99 deck latency, peak memory (tracemalloc, on a separate run) and the time the
+event loop was blocked. With --baseline the run fails on a regression over --tolerance.
+
+python -m benchmarks.bench_agents [--slides 3 15 50] [--decks 6] [--concurrency 2]
+    [--llm-latency 0.05] [--http-latency 0.01] [--json results.json] [--baseline results.json]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+from statistics import quantiles
+
+os.environ.setdefault("TAVILY_API_KEY", "offline")
+os.environ.setdefault("OPENAI_API_KEY", "offline")
+
+import dspy
+import tool
+from benchmarks.fakes import Distribution, FixtureServer, ScriptedLM, agent_responders
+from agent_pool import get_agent_pool
+from document_store import configure_document_store
+from http_client import close_session
+from llm import configure_llm_cache
+from presentation_agent import PresentationAIAgent
+from tool_cache import configure_tool_cache
+from trajectory_store import configure_trajectory_storage
+
+TASK = "Agentic workflows for enterprises"
+# compared against the baseline: lower is better for the latencies, higher for the throughput.
+GATED_METRICS = {"p95_seconds": -1, "p99_seconds": -1, "slides_per_second": 1}
+
+
+class LoopMonitor:
+    """Sleeps 'interval' in a loop and counts any oversleep above 'threshold' as blocked time."""
+
+    def __init__(self, interval: float = 0.005, threshold: float = 0.01):
+        self.interval, self.threshold = interval, threshold
+        self.blocked_seconds = 0.0
+        self.max_lag_seconds = 0.0
+        self._task = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = time.perf_counter() - start - self.interval
+            self.max_lag_seconds = max(self.max_lag_seconds, lag)
+            if lag > self.threshold:
+                self.blocked_seconds += lag
+
+    def __enter__(self) -> "LoopMonitor":
+        self._task = asyncio.ensure_future(self._run())
+        return self
+
+    def __exit__(self, *exc_info):
+        self._task.cancel()
+
+
+def percentile(values: list, percent: int) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return quantiles(values, n=100, method="inclusive")[percent - 1]
+
+
+async def run_decks(decks: int, concurrency: int) -> list:
+    """Build 'decks' presentations, 'concurrency' at a time. Returns the latency of each deck."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def deck() -> float:
+        async with semaphore:
+            start = time.perf_counter()
+            await get_agent_pool().handle(PresentationAIAgent).forward(task=TASK)
+            return time.perf_counter() - start
+
+    try:
+        return await asyncio.gather(*[deck() for _ in range(decks)])
+    finally:
+        await close_session()
+
+
+async def run_scenario(args, slides: int) -> dict:
+    lm = ScriptedLM(
+        agent_responders(slides, Distribution(args.response_words, 0.5, seed=slides)),
+        latency=Distribution(args.llm_latency, args.llm_sigma, seed=slides),
+    )
+    dspy.configure(lm=lm)
+    configure_tool_cache()
+
+    with LoopMonitor(threshold=args.block_threshold) as monitor:
+        start = time.perf_counter()
+        latencies = await run_decks(args.decks, args.concurrency)
+        elapsed = time.perf_counter() - start
+    llm_calls = lm.calls
+
+    # memory on its own run: tracemalloc slows down every allocation.
+    configure_tool_cache()
+    tracemalloc.start()
+    await run_decks(args.concurrency, args.concurrency)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "slides": slides,
+        "decks": args.decks,
+        "decks_per_second": args.decks / elapsed,
+        "slides_per_second": args.decks * slides / elapsed,
+        "p50_seconds": percentile(latencies, 50),
+        "p95_seconds": percentile(latencies, 95),
+        "p99_seconds": percentile(latencies, 99),
+        "llm_calls_per_deck": llm_calls / args.decks,
+        "peak_memory_mb": peak / 2**20,
+        "loop_blocked_seconds": monitor.blocked_seconds,
+        "loop_max_lag_seconds": monitor.max_lag_seconds,
+    }
+
+
+def regressions(results: list, baseline: list, tolerance: float) -> list:
+    previous = {result["slides"]: result for result in baseline}
+    found = []
+    for result in results:
+        before = previous.get(result["slides"])
+        if before is None:
+            continue
+        for metric, direction in GATED_METRICS.items():
+            change = (result[metric] - before[metric]) / (before[metric] or 1e-9)
+            if change * direction < -tolerance:
+                found.append(
+                    f"{result['slides']} slides {metric}: {before[metric]:.3f} -> {result[metric]:.3f}"
+                )
+    return found
+
+
+async def main(args) -> list:
+    configure_llm_cache(enabled=False)
+    configure_document_store(enabled=False)
+    # the agent graphs are built once per process, not part of a deck.
+    get_agent_pool().warm(PresentationAIAgent)
+    # the large trajectory payloads go to a blob store like in a logged run, a temporary one.
+    with tempfile.TemporaryDirectory(prefix="bench-blobs-") as blob_dir, FixtureServer(
+        latency=Distribution(args.http_latency, args.http_sigma, seed=1)
+    ) as server:
+        configure_trajectory_storage(blob_dir=blob_dir)
+        tool.TAVILY_API_URL = server.url
+        print(
+            f"{'slides':>6}{'decks/s':>9}{'slides/s':>10}{'p50':>9}{'p95':>9}{'p99':>9}"
+            f"{'llm/deck':>10}{'peak MB':>9}{'blocked':>10}{'max lag':>9}"
+        )
+        results = []
+        for slides in args.slides:
+            result = await run_scenario(args, slides)
+            results.append(result)
+            print(
+                f"{slides:>6}{result['decks_per_second']:>9.2f}{result['slides_per_second']:>10.1f}"
+                f"{result['p50_seconds']:>8.2f}s{result['p95_seconds']:>8.2f}s{result['p99_seconds']:>8.2f}s"
+                f"{result['llm_calls_per_deck']:>10.0f}{result['peak_memory_mb']:>9.1f}"
+                f"{result['loop_blocked_seconds'] * 1000:>8.0f}ms{result['loop_max_lag_seconds'] * 1000:>7.0f}ms"
+            )
+        print(f"http requests: {server.requests}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--slides", type=int, nargs="+", default=[3, 15, 50])
+    parser.add_argument("--decks", type=int, default=6)
+    parser.add_argument("--concurrency", type=int, default=2)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--llm-sigma", type=float, default=0.3)
+    parser.add_argument("--http-latency", type=float, default=0.01)
+    parser.add_argument("--http-sigma", type=float, default=0.3)
+    parser.add_argument("--response-words", type=float, default=120)
+    parser.add_argument("--block-threshold", type=float, default=0.01)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument(
+        "--baseline", help="results file of a previous run to compare with"
+    )
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = asyncio.run(main(args))
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            found = regressions(results, json.load(file), args.tolerance)
+        for regression in found:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if found else 0)
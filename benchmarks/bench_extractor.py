@@ -0,0 +1,81 @@
+"""Micro-benchmark of the HTML to text extractors on the saved fixtures.
+
+python -m benchmarks.bench_extractor [--repeat 20] [--max-chars 5000] [--processes 4]
+"""
+
+import argparse
+import time
+from pathlib import Path
+from statistics import median
+from utils import custom_extractor
+from extractor import EXTRACTOR_BACKENDS, extract_many
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures" / "html"
+
+
+def load_fixtures() -> dict:
+    return {
+        path.name: path.read_text(encoding="utf-8")
+        for path in sorted(FIXTURES_DIR.glob("*.html"))
+    }
+
+
+def time_per_page(extractor, html: str, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        extractor(html)
+        timings.append(time.perf_counter() - start)
+    return median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--max-chars", type=int, default=5000)
+    parser.add_argument("--processes", type=int, default=4)
+    args = parser.parse_args()
+
+    fixtures = load_fixtures()
+    extractors = {"custom_extractor": custom_extractor}
+    for backend, extract_page in EXTRACTOR_BACKENDS.items():
+        extractors[backend] = lambda html, extract_page=extract_page: extract_page(html)
+        extractors[f"{backend}[:{args.max_chars}]"] = (
+            lambda html, extract_page=extract_page: extract_page(html, args.max_chars)
+        )
+
+    print(f"{'fixture':<22}{'kB':>7}  " + "".join(f"{name:>16}" for name in extractors))
+    totals = dict.fromkeys(extractors, 0.0)
+    for name, html in fixtures.items():
+        row = f"{name:<22}{len(html) / 1024:>7.0f}  "
+        for extractor_name, extractor in extractors.items():
+            seconds = time_per_page(extractor, html, args.repeat)
+            totals[extractor_name] += seconds
+            row += f"{seconds * 1000:>14.2f}ms"
+        print(row)
+
+    baseline = totals["custom_extractor"]
+    print(
+        f"{'total':<29}"
+        + "".join(f"{seconds * 1000:>14.2f}ms" for seconds in totals.values())
+    )
+    print(
+        f"{'speedup':<29}"
+        + "".join(f"{baseline / seconds:>15.1f}x" for seconds in totals.values())
+    )
+
+    # batch throughput, inline vs process pool.
+    batch = list(fixtures.values()) * args.repeat
+    for processes in (0, args.processes):
+        start = time.perf_counter()
+        extract_many(
+            batch, max_chars=args.max_chars, backend="fast", processes=processes
+        )
+        elapsed = time.perf_counter() - start
+        print(
+            f"extract_many fast processes={processes}: {len(batch) / elapsed:.0f} pages/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
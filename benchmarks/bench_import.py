@@ -0,0 +1,73 @@
+"""Import time of the modules, each in a fresh interpreter (python -X importtime).
+
+python -m benchmarks.bench_import [--top 10] [module ...]
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+REPO_DIR = Path(__file__).parent.parent
+DEFAULT_MODULES = [
+    "utils",
+    "extractor",
+    "http_client",
+    "tool",
+    "action",
+    "search_agent",
+    "presentation_agent",
+]
+
+
+def import_time(module: str) -> tuple:
+    """Wall time of 'import module' and the (self us, cumulative us, name) rows of -X importtime."""
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_DIR,
+        capture_output=True,
+        text=True,
+    )
+    elapsed = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        rows.append((int(self_us), int(cumulative_us), name.rstrip()))
+    return elapsed, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'module':<22}{'wall':>10}{'import':>10}")
+    heaviest = {}
+    for module in args.modules:
+        elapsed, rows = import_time(module)
+        own = next(
+            (cumulative for _, cumulative, name in rows if name.strip() == module), 0
+        )
+        print(f"{module:<22}{elapsed * 1000:>8.0f}ms{own / 1000:>8.0f}ms")
+        # direct imports of the module only, their cumulative time includes their own imports.
+        for _, cumulative, name in rows:
+            if len(name) - len(name.lstrip()) == 3:
+                package = name.strip()
+                heaviest[package] = max(heaviest.get(package, 0), cumulative)
+
+    print("\nheaviest direct imports:")
+    for package, cumulative in sorted(heaviest.items(), key=lambda item: -item[1])[
+        : args.top
+    ]:
+        print(f"  {package:<30}{cumulative / 1000:>8.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
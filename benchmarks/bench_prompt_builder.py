@@ -0,0 +1,88 @@
+"""Benchmark of the prompt builders of utils against the previous concatenation based ones.
+
+python -m benchmarks.bench_prompt_builder [--responses 50] [--response-kb 20] [--repeat 20]
+"""
+
+import argparse
+import time
+from statistics import median
+from tools_agents_selection import ToolResponse, ToolWithArgsValues
+from utils import create_content_for_tools_operation_response
+
+
+def concatenation_builder(tools_operation_response) -> str:
+    # the builder as it was: string concatenation in a loop and indented triple-quoted blocks.
+    content = """The tools below have generated the corresonding responses after running:
+    
+    
+    """
+    for idx, (tool_response) in enumerate(tools_operation_response):
+        tool_content = f"""
+        
+        Tool[{idx + 1}]_NAME: {tool_response.tool.tool_name} 
+        Tool[{idx+1}]_RESPONSE: {tool_response.response}
+        
+        """
+        content = content + tool_content
+    return content
+
+
+def make_responses(count: int, response_kb: int) -> list:
+    paragraph = "Agentic workflows coordinate tools and team agents. " * 20
+    response = (paragraph * (response_kb * 1024 // len(paragraph) + 1))[
+        : response_kb * 1024
+    ]
+    return [
+        ToolResponse(
+            tool=ToolWithArgsValues(
+                tool_name="website_scrapper", argument_values={"url": f"https://x/{i}"}
+            ),
+            response=response,
+        )
+        for i in range(count)
+    ]
+
+
+def timed(build, repeat: int) -> tuple:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        content = build()
+        timings.append(time.perf_counter() - start)
+    return median(timings), content
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--responses", type=int, default=50)
+    parser.add_argument("--response-kb", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    responses = make_responses(args.responses, args.response_kb)
+    # padding only: same entries with empty responses.
+    small_responses = make_responses(args.responses, 0)
+    max_chars = args.responses * args.response_kb * 1024 // 4
+    builders = {
+        "concatenation": lambda items: concatenation_builder(items),
+        "render_prompt": lambda items: create_content_for_tools_operation_response(
+            items
+        ),
+        f"render_prompt[:{max_chars}]": lambda items: create_content_for_tools_operation_response(
+            items, max_chars=max_chars
+        ),
+    }
+
+    print(f"{args.responses} responses of {args.response_kb} kB")
+    print(f"{'builder':<28}{'time':>10}{'chars':>12}{'overhead/entry':>16}")
+    for name, build in builders.items():
+        seconds, content = timed(lambda: build(responses), args.repeat)
+        _, padding = timed(lambda: build(small_responses), 1)
+        overhead = len(padding) / args.responses
+        print(
+            f"{name:<28}{seconds * 1000:>8.2f}ms{len(content):>12}{overhead:>14.0f}ch"
+        )
+
+
+if __name__ == "__main__":
+    main()
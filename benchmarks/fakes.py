@@ -0,0 +1,267 @@
+"""Deterministic stand-ins for the OpenAI, Tavily and website backends, to run the agents offline.
+
+- ScriptedLM: dspy LM answering every signature of the repo from its prompt, with a latency and a
+  response length drawn from seeded distributions.
+- FixtureServer: local HTTP server serving the saved HTML fixtures as websites and a stub of the
+  Tavily search API pointing at them.
+"""
+
+import re
+import json
+import time
+import random
+import itertools
+import threading
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+from dsp.modules.lm import LM
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures" / "html"
+REASONING_PREFIX = "Reasoning: Let's think step by step in order to"
+WORDS = """agentic workflows coordinate tools and team agents to research a topic browse the
+web summarize sources review drafts and build slides with accurate content for enterprises""".split()
+
+
+class Distribution:
+    """Lognormal samples around 'median' ('sigma' = 0 for a constant), seeded for reproducibility."""
+
+    def __init__(self, median: float, sigma: float = 0.0, seed: int = 0):
+        self.median, self.sigma = median, sigma
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        if self.sigma <= 0 or self.median <= 0:
+            return self.median
+        with self._lock:
+            return self.median * self._random.lognormvariate(0.0, self.sigma)
+
+
+def input_value(prompt: str, prefix: str) -> str:
+    """Value of the input field 'prefix' in the last example of the prompt (the actual call)."""
+    matches = re.findall(rf"^{re.escape(prefix)}: (.*)$", prompt, re.M)
+    return matches[-1] if matches else ""
+
+
+def input_json(prompt: str, prefix: str) -> dict:
+    try:
+        return json.loads(input_value(prompt, prefix))
+    except ValueError:
+        return {}
+
+
+class ScriptedLM(LM):
+    """Fake dspy LM. 'responders' map the prefix of an output field ('Final Response', ...) to a
+    function building the value of that field from the prompt; the first responder whose output
+    field is in the prompt answers. Every call sleeps a 'latency' sample, like a blocking client.
+    """
+
+    def __init__(
+        self,
+        responders: Dict[str, Callable[[str], str]],
+        latency: Optional[Distribution] = None,
+        model: str = "scripted",
+        **kwargs,
+    ):
+        super().__init__(model)
+        self.provider = "scripted"
+        self.kwargs.update(kwargs)
+        self.responders = responders
+        self.latency = latency or Distribution(0.0)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def basic_request(self, prompt: str, **kwargs):
+        for prefix, responder in self.responders.items():
+            if f"\n{prefix}:" in prompt:
+                value = responder(prompt)
+                if prompt.rstrip().endswith(REASONING_PREFIX):
+                    return f"produce the {prefix.lower()}.\n\n{prefix}: {value}"
+                return value
+        raise ValueError("no responder for the prompt")
+
+    def __call__(self, prompt, only_completed=True, return_sorted=False, **kwargs):
+        time.sleep(self.latency.sample())
+        completion = self.basic_request(prompt, **kwargs)
+        with self._lock:
+            self.calls += 1
+            self.history.append(
+                {"prompt": prompt, "response": completion, "kwargs": kwargs}
+            )
+        return [completion] * kwargs.get("n", 1)
+
+    def copy(self, **kwargs):
+        return ScriptedLM(self.responders, self.latency, **{**self.kwargs, **kwargs})
+
+
+def text(words: Distribution, seed: int) -> str:
+    count = max(1, int(words.sample()))
+    rotated = WORDS[seed % len(WORDS) :] + WORDS[: seed % len(WORDS)]
+    return " ".join(itertools.islice(itertools.cycle(rotated), count))
+
+
+def agent_responders(
+    slides: int, words: Distribution
+) -> Dict[str, Callable[[str], str]]:
+    """Responders of the presentation and search agents: outlines of 'slides' slides (unique titles
+    per deck, so nothing is cached across decks), the search agent picks internet_search, the
+    presentation agent its search agent, answers of 'words' words.
+    """
+    decks = itertools.count()
+
+    def outline(prompt: str) -> str:
+        deck = next(decks)
+        task = input_json(prompt, "Presentation Input").get("task", "")
+        return json.dumps(
+            {
+                "outline": [
+                    {
+                        "title": f"{str(task)[:40]} deck {deck} part {index + 1}",
+                        "content_outline": text(words, index),
+                    }
+                    for index in range(slides)
+                ]
+            }
+        )
+
+    def select(prompt: str) -> str:
+        task = input_json(prompt, "Task Context").get("task", "")
+        available = input_json(prompt, "Available Tools And Agents")
+        tools = [tool["tool_name"] for tool in available.get("available_tools", [])]
+        agents = [
+            agent["agent_name"] for agent in available.get("available_agents", [])
+        ]
+        selected = {
+            "tools_to_run": [],
+            "agents_to_execute": [],
+            "reasoning": "scripted",
+        }
+        if "internet_search" in tools:
+            # the slide tasks share their instructions, their titles make the queries.
+            title = re.search(r"title: (.*)", str(task))
+            query = (title.group(1) if title else str(task))[:100]
+            selected["tools_to_run"] = [
+                {"tool_name": "internet_search", "argument_values": {"query": query}}
+            ]
+        elif agents:
+            selected["agents_to_execute"] = [
+                {"agent_name": agents[0], "argument_values": {"task": str(task)}}
+            ]
+        return json.dumps(selected)
+
+    def search_answer(prompt: str) -> str:
+        return json.dumps({"answer": text(words, len(prompt))})
+
+    def final_response(prompt: str) -> str:
+        return text(words, len(prompt))
+
+    def review(prompt: str) -> str:
+        # the deck as given, the review pass only costs its latency.
+        return json.dumps(input_json(prompt, "Current Presentation"))
+
+    return {
+        "Presentation Outline Output": outline,
+        "Selected Tools And Agents": select,
+        "Search Answer": search_answer,
+        "Cleaned Presentation": review,
+        "Final Response": final_response,
+    }
+
+
+class FixtureServer:
+    """Serves the HTML fixtures at /pages/<n> (fixture n modulo their count, ETag'd) and a stub of
+    the Tavily API at POST /search returning 'results_per_query' of those pages. Every request
+    sleeps a 'latency' sample. Runs in a thread, its address is 'url'.
+    """
+
+    def __init__(
+        self,
+        latency: Optional[Distribution] = None,
+        results_per_query: int = 5,
+        host: str = "127.0.0.1",
+    ):
+        self.latency = latency or Distribution(0.0)
+        self.results_per_query = results_per_query
+        self.pages: List[bytes] = [
+            path.read_bytes() for path in sorted(FIXTURES_DIR.glob("*.html"))
+        ]
+        self.requests = 0
+        self._queries = itertools.count()
+        self._server = ThreadingHTTPServer((host, 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: bytes, content_type: str, **headers):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                server.requests += 1
+                time.sleep(server.latency.sample())
+                match = re.fullmatch(r"/pages/(\d+)", self.path)
+                if not match:
+                    return self._send(404, b"not found", "text/plain")
+                etag = f'"{match.group(1)}"'
+                if self.headers.get("If-None-Match") == etag:
+                    return self._send(304, b"", "text/html", ETag=etag)
+                page = server.pages[int(match.group(1)) % len(server.pages)]
+                self._send(200, page, "text/html; charset=utf-8", ETag=etag)
+
+            def do_POST(self):
+                server.requests += 1
+                payload = json.loads(
+                    self.rfile.read(int(self.headers["Content-Length"]))
+                )
+                time.sleep(server.latency.sample())
+                if self.path != "/search":
+                    return self._send(404, b"not found", "text/plain")
+                first = next(server._queries) * server.results_per_query
+                count = min(payload.get("max_results") or 5, server.results_per_query)
+                results = [
+                    {
+                        "url": f"{server.url}/pages/{first + index}",
+                        "title": f"Result {index + 1} for {payload['query']}",
+                        "content": text(Distribution(40), first + index),
+                        "score": 1.0 / (index + 1),
+                    }
+                    for index in range(count)
+                ]
+                body = {
+                    "query": payload["query"],
+                    "answer": text(Distribution(40), first),
+                }
+                self._send(
+                    200,
+                    json.dumps({**body, "results": results}).encode(),
+                    "application/json",
+                )
+
+        return Handler
+
+    def __enter__(self) -> "FixtureServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,211 @@
+import os
+import time
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+from pydantic import BaseModel
+from pydantic.fields import Field
+
+
+class CacheStats(BaseModel):
+    hits: int = Field(0, description="Lookups served from any tier.")
+    misses: int = Field(0, description="Lookups served from no tier.")
+    memory_hits: int = Field(0, description="Lookups served from the in-memory tier.")
+    disk_hits: int = Field(0, description="Lookups served from the on-disk tier.")
+    evictions: int = Field(0, description="Entries dropped because of size limits.")
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class LRUCache:
+    """Thread safe in-memory LRU with an optional time to live (seconds) per entry."""
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._entries: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.stats.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            self.stats.memory_hits += 1
+            return entry[1]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else float("inf")
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """On-disk tier: text values with a time to live (seconds), evicted least recently used beyond 'max_bytes'."""
+
+    def __init__(
+        self,
+        path: str,
+        ttl: Optional[float] = None,
+        max_bytes: int = 256 * 1024 * 1024,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("""CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )""")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)"
+            )
+
+    def get(self, key: str, default: Any = None) -> Any:
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT value FROM cache WHERE key = ? AND expires_at >= ?", (key, now)
+            ).fetchone()
+            if row is None:
+                self.stats.misses += 1
+                return default
+            self._connection.execute(
+                "UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+        self.stats.hits += 1
+        self.stats.disk_hits += 1
+        return row[0]
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else float("inf")
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), expires_at, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now: float):
+        self._connection.execute("DELETE FROM cache WHERE expires_at < ?", (now,))
+        (total_bytes,) = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM cache"
+        ).fetchone()
+        if total_bytes <= self.max_bytes:
+            return
+        # drop the least recently used entries until the cache fits again.
+        freed = 0
+        for key, size in self._connection.execute(
+            "SELECT key, size FROM cache ORDER BY accessed_at"
+        ).fetchall():
+            if total_bytes - freed <= self.max_bytes:
+                break
+            self._connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+            freed += size
+            self.stats.evictions += 1
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM cache")
+
+    def close(self):
+        self._connection.close()
+
+
+class TieredCache:
+    """In-memory LRU in front of an optional on-disk tier. Disk hits are promoted to memory."""
+
+    def __init__(self, memory: LRUCache, disk: Optional[SQLiteCache] = None):
+        self.memory = memory
+        self.disk = disk
+        self.stats = CacheStats()
+
+    def _memory_get(self, key: str) -> Any:
+        value = self.memory.get(key)
+        if value is not None:
+            self.stats.hits += 1
+            self.stats.memory_hits += 1
+        return value
+
+    def _disk_result(self, key: str, value: Any) -> Any:
+        if value is not None:
+            self.memory.set(key, value)
+            self.stats.hits += 1
+            self.stats.disk_hits += 1
+        else:
+            self.stats.misses += 1
+        return value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self._memory_get(key)
+        if value is None:
+            value = self._disk_result(
+                key, self.disk.get(key) if self.disk is not None else None
+            )
+        return default if value is None else value
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        self.memory.set(key, value, ttl=ttl)
+        if self.disk is not None:
+            self.disk.set(key, value, ttl=ttl)
+
+    async def aget(self, key: str, default: Any = None) -> Any:
+        """'get' for the event loop: only the memory tier is read on the loop, the disk tier (SQLite)
+        in a worker thread.
+        """
+        value = self._memory_get(key)
+        if value is None:
+            value = self._disk_result(
+                key,
+                (
+                    await asyncio.to_thread(self.disk.get, key)
+                    if self.disk is not None
+                    else None
+                ),
+            )
+        return default if value is None else value
+
+    async def aset(self, key: str, value: str, ttl: Optional[float] = None):
+        """'set' for the event loop, the disk tier is written in a worker thread."""
+        self.memory.set(key, value, ttl=ttl)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, value, ttl)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
@@ -0,0 +1,60 @@
+import time
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Iterator, Optional
+
+# absolute deadline (time.monotonic()) of the running request. Tasks copy the context when they
+# are created, so nested agents, tools and LLM calls all see the deadline of their caller.
+current_deadline: ContextVar[Optional[float]] = ContextVar(
+    "current_deadline", default=None
+)
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """The time budget of the request (or of a node of the agent tree) ran out."""
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline, None without deadline."""
+    deadline = current_deadline.get()
+    return max(0.0, deadline - time.monotonic()) if deadline is not None else None
+
+
+@contextmanager
+def deadline_scope(timeout: Optional[float]) -> Iterator[Optional[float]]:
+    """Run the block within 'timeout' seconds. A nested scope can only shorten the enclosing deadline."""
+    deadline = current_deadline.get()
+    if timeout is not None:
+        scoped = time.monotonic() + timeout
+        deadline = scoped if deadline is None else min(deadline, scoped)
+    token = current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        current_deadline.reset(token)
+
+
+async def with_deadline(
+    awaitable: Awaitable[Any], timeout: Optional[float] = None
+) -> Any:
+    """Await within 'timeout' and the current deadline, whichever comes first.
+
+    On expiry the awaitable is cancelled (with its subtree of tasks) and DeadlineExceeded is raised.
+    """
+    budget = remaining()
+    if timeout is not None:
+        budget = timeout if budget is None else min(budget, timeout)
+    if budget is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, timeout=budget)
+    except asyncio.TimeoutError as e:
+        if isinstance(e, DeadlineExceeded):
+            raise
+        raise DeadlineExceeded(f"no result within {budget:.1f}s") from e
+
+
+def describe_error(error: BaseException) -> str:
+    """Error info kept on a failed node of the agent tree."""
+    return f"{type(error).__name__}: {error}" if str(error) else type(error).__name__
@@ -0,0 +1,269 @@
+import os
+import json
+import math
+import time
+import zlib
+import sqlite3
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel
+from pydantic.fields import Field
+from passages import tokenize
+from url_registry import canonicalize_url
+
+DEFAULT_DOCUMENT_STORE_PATH = os.getenv(
+    "DOCUMENT_STORE_PATH",
+    os.path.join(
+        os.path.expanduser("~"), ".cache", "agents_tutorial", "documents.sqlite3"
+    ),
+)
+# stored pages younger than this are served without any request, older ones are revalidated.
+DEFAULT_REVALIDATE_AFTER = float(os.getenv("DOCUMENT_STORE_REVALIDATE_AFTER", "86400"))
+
+
+class StoredDocument(BaseModel):
+    url: str = Field(..., description="Canonical URL of the page.")
+    text: str = Field("", description="Extracted text of the page.")
+    metadata: Dict[str, Any] = Field(default_factory=dict)
+    etag: Optional[str] = Field(None, description="ETag of the last 200 response.")
+    last_modified: Optional[str] = Field(
+        None, description="Last-Modified of the last 200 response."
+    )
+    fetched_at: float = Field(0.0, description="Last fetch or revalidation time.")
+    complete: bool = Field(
+        True, description="False when the text was cut by a character budget."
+    )
+    links: Optional[List[str]] = Field(
+        None, description="Sub links of the page, None when they were not extracted."
+    )
+    score: float = Field(0.0, description="BM25 score of a search result.")
+    coverage: float = Field(
+        0.0, description="Share of the query terms found in a search result."
+    )
+
+    def conditional_headers(self) -> Dict[str, str]:
+        """Headers revalidating the stored copy (If-None-Match / If-Modified-Since)."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class DocumentStore:
+    """On-disk corpus of scraped pages (zlib compressed text and metadata keyed by canonical URL)
+    with an inverted index kept up to date on every write, searchable with BM25.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_DOCUMENT_STORE_PATH,
+        revalidate_after: float = DEFAULT_REVALIDATE_AFTER,
+    ):
+        self.path = path
+        self.revalidate_after = revalidate_after
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("""CREATE TABLE IF NOT EXISTS documents (
+                    id INTEGER PRIMARY KEY,
+                    url TEXT UNIQUE NOT NULL,
+                    text BLOB NOT NULL,
+                    metadata TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    fetched_at REAL NOT NULL,
+                    complete INTEGER NOT NULL,
+                    links TEXT,
+                    length INTEGER NOT NULL
+                )""")
+            self._connection.execute("""CREATE TABLE IF NOT EXISTS postings (
+                    term TEXT NOT NULL,
+                    document_id INTEGER NOT NULL,
+                    frequency INTEGER NOT NULL,
+                    PRIMARY KEY (term, document_id)
+                ) WITHOUT ROWID""")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS postings_document ON postings (document_id)"
+            )
+
+    @staticmethod
+    def key(url: str) -> str:
+        return canonicalize_url(url)
+
+    def _document(self, row: tuple) -> StoredDocument:
+        url, text, metadata, etag, last_modified, fetched_at, complete, links = row
+        return StoredDocument(
+            url=url,
+            text=zlib.decompress(text).decode("utf-8"),
+            metadata=json.loads(metadata),
+            etag=etag,
+            last_modified=last_modified,
+            fetched_at=fetched_at,
+            complete=bool(complete),
+            links=json.loads(links) if links is not None else None,
+        )
+
+    def get(self, url: str) -> Optional[StoredDocument]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT url, text, metadata, etag, last_modified, fetched_at, complete, links"
+                " FROM documents WHERE url = ?",
+                (self.key(url),),
+            ).fetchone()
+        return self._document(row) if row is not None else None
+
+    def is_fresh(self, document: StoredDocument) -> bool:
+        return time.time() - document.fetched_at < self.revalidate_after
+
+    def put(
+        self,
+        url: str,
+        text: str,
+        metadata: Optional[Dict[str, Any]] = None,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        complete: bool = True,
+        links: Optional[List[str]] = None,
+    ):
+        """Store the page and re-index it."""
+        terms = Counter(tokenize(text))
+        with self._lock, self._connection:
+            (document_id,) = self._connection.execute(
+                """INSERT INTO documents
+                    (url, text, metadata, etag, last_modified, fetched_at, complete, links, length)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (url) DO UPDATE SET
+                    text = excluded.text, metadata = excluded.metadata, etag = excluded.etag,
+                    last_modified = excluded.last_modified, fetched_at = excluded.fetched_at,
+                    complete = excluded.complete, links = excluded.links, length = excluded.length
+                RETURNING id""",
+                (
+                    self.key(url),
+                    zlib.compress(text.encode("utf-8")),
+                    json.dumps(metadata or {}, default=str),
+                    etag,
+                    last_modified,
+                    time.time(),
+                    int(complete),
+                    json.dumps(links) if links is not None else None,
+                    sum(terms.values()),
+                ),
+            ).fetchone()
+            self._connection.execute(
+                "DELETE FROM postings WHERE document_id = ?", (document_id,)
+            )
+            self._connection.executemany(
+                "INSERT INTO postings VALUES (?, ?, ?)",
+                [(term, document_id, frequency) for term, frequency in terms.items()],
+            )
+
+    def touch(self, url: str):
+        """The stored copy was revalidated (304 Not Modified)."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE documents SET fetched_at = ? WHERE url = ?",
+                (time.time(), self.key(url)),
+            )
+
+    def search(
+        self,
+        query: str,
+        limit: int = 5,
+        min_coverage: float = 0.0,
+        max_age: Optional[float] = None,
+        k1: float = 1.5,
+        b: float = 0.75,
+    ) -> List[StoredDocument]:
+        """Best stored pages for 'query' (BM25), with at least 'min_coverage' of the query terms
+        and fetched less than 'max_age' seconds ago.
+        """
+        query_terms = sorted(set(tokenize(query)))
+        if not query_terms:
+            return []
+        placeholders = ", ".join("?" * len(query_terms))
+        min_fetched_at = time.time() - max_age if max_age is not None else 0.0
+        with self._lock:
+            # the corpus statistics over the same documents as the postings (max_age filter).
+            count, average_length = self._connection.execute(
+                "SELECT COUNT(*), AVG(length) FROM documents WHERE fetched_at >= ?",
+                (min_fetched_at,),
+            ).fetchone()
+            postings = self._connection.execute(
+                f"""SELECT postings.term, postings.document_id, postings.frequency, documents.length
+                FROM postings JOIN documents ON documents.id = postings.document_id
+                WHERE postings.term IN ({placeholders}) AND documents.fetched_at >= ?""",
+                (*query_terms, min_fetched_at),
+            ).fetchall()
+        if not postings:
+            return []
+
+        document_frequencies = Counter(term for term, _, _, _ in postings)
+        scores: Dict[int, float] = {}
+        matched: Dict[int, int] = Counter()
+        for term, document_id, frequency, length in postings:
+            idf = math.log(
+                1
+                + (count - document_frequencies[term] + 0.5)
+                / (document_frequencies[term] + 0.5)
+            )
+            norm = k1 * (1 - b + b * length / (average_length or 1))
+            scores[document_id] = scores.get(document_id, 0.0) + idf * frequency * (
+                k1 + 1
+            ) / (frequency + norm)
+            matched[document_id] += 1
+
+        ranked = [
+            document_id
+            for document_id in sorted(scores, key=scores.get, reverse=True)
+            if matched[document_id] / len(query_terms) >= min_coverage
+        ][:limit]
+        documents = []
+        for document_id in ranked:
+            with self._lock:
+                row = self._connection.execute(
+                    "SELECT url, text, metadata, etag, last_modified, fetched_at, complete, links"
+                    " FROM documents WHERE id = ?",
+                    (document_id,),
+                ).fetchone()
+            document = self._document(row)
+            document.score = scores[document_id]
+            document.coverage = matched[document_id] / len(query_terms)
+            documents.append(document)
+        return documents
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM documents"
+            ).fetchone()[0]
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM postings")
+            self._connection.execute("DELETE FROM documents")
+
+    def close(self):
+        self._connection.close()
+
+
+_document_store: Optional[DocumentStore] = None
+_document_store_enabled = os.getenv("DOCUMENT_STORE", "1") != "0"
+
+
+def configure_document_store(enabled: bool = True, **kwargs) -> Optional[DocumentStore]:
+    global _document_store, _document_store_enabled
+    _document_store_enabled = enabled
+    _document_store = DocumentStore(**kwargs) if enabled else None
+    return _document_store
+
+
+def get_document_store() -> Optional[DocumentStore]:
+    if _document_store is None and _document_store_enabled:
+        configure_document_store()
+    return _document_store
@@ -0,0 +1,240 @@
+import os
+import re
+import asyncio
+import importlib.util
+from functools import partial
+from html.parser import HTMLParser
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# elements whose text is never useful content for the agents.
+BOILERPLATE_TAGS = frozenset(
+    {
+        "script",
+        "style",
+        "noscript",
+        "template",
+        "svg",
+        "iframe",
+        "nav",
+        "footer",
+        "aside",
+    }
+)
+BLOCK_TAGS = frozenset(
+    {
+        "p",
+        "div",
+        "br",
+        "li",
+        "tr",
+        "section",
+        "article",
+        "h1",
+        "h2",
+        "h3",
+        "h4",
+        "h5",
+        "h6",
+        "pre",
+        "blockquote",
+    }
+)
+CHUNK_SIZE = 16 * 1024
+
+_newline_spaces = re.compile(r" ?\n ?")
+_newlines = re.compile(r"\n{2,}")
+
+
+def _join_parts(parts: List[str], max_chars: Optional[int]) -> str:
+    text = _newline_spaces.sub("\n", " ".join(parts))
+    text = _newlines.sub("\n", text).strip()
+    return text[:max_chars] if max_chars is not None else text
+
+
+def _collapse_whitespace(text: str, max_chars: Optional[int]) -> str:
+    text = "\n".join(
+        " ".join(line.split()) for line in text.splitlines() if line.strip()
+    )
+    return text[:max_chars] if max_chars is not None else text
+
+
+class _TextParser(HTMLParser):
+    """Streaming tokenizer collecting visible text (and the page metadata) until 'max_chars' is reached."""
+
+    def __init__(self, max_chars: Optional[int] = None):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.parts: List[str] = []
+        self.metadata: Dict[str, Optional[str]] = {}
+        self.n_chars = 0
+        self.done = False
+        self._skip_depth = 0
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in BOILERPLATE_TAGS:
+            self._skip_depth += 1
+        elif tag in BLOCK_TAGS:
+            self.parts.append("\n")
+        elif tag == "title":
+            self._in_title = True
+        elif tag == "meta":
+            attrs = dict(attrs)
+            if (attrs.get("name") or "").lower() == "description":
+                self.metadata["description"] = attrs.get("content")
+        elif tag == "html":
+            self.metadata["language"] = dict(attrs).get("lang")
+
+    def handle_endtag(self, tag):
+        if tag in BOILERPLATE_TAGS:
+            self._skip_depth = max(self._skip_depth - 1, 0)
+        elif tag in BLOCK_TAGS:
+            self.parts.append("\n")
+        elif tag == "title":
+            self._in_title = False
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.metadata["title"] = self.metadata.get("title", "") + data
+            return
+        if self._skip_depth or self.done:
+            return
+        text = " ".join(data.split())
+        if text:
+            self.parts.append(text)
+            self.n_chars += len(text) + 1
+            if self.max_chars is not None and self.n_chars >= self.max_chars:
+                self.done = True
+
+
+def fast_extract_page(html: str, max_chars: Optional[int] = None) -> Tuple[str, dict]:
+    parser = _TextParser(max_chars=max_chars)
+    for start in range(0, len(html), CHUNK_SIZE):
+        parser.feed(html[start : start + CHUNK_SIZE])
+        if parser.done:
+            break
+    else:
+        parser.close()
+    return _join_parts(parser.parts, max_chars), parser.metadata
+
+
+def lxml_extract_page(html: str, max_chars: Optional[int] = None) -> Tuple[str, dict]:
+    from lxml import etree
+    from lxml import html as lxml_html
+
+    if not html.strip():
+        return "", {}
+    # lxml refuses str input carrying an encoding declaration, bytes are fine.
+    tree = lxml_html.document_fromstring(html.encode("utf-8", errors="replace"))
+    metadata = {
+        "title": tree.findtext(".//title"),
+        "description": next(
+            iter(tree.xpath("//meta[@name='description']/@content")), None
+        ),
+        "language": tree.get("lang"),
+    }
+    etree.strip_elements(tree, etree.Comment, *BOILERPLATE_TAGS, with_tail=False)
+    body = tree.find("body")
+    body = body if body is not None else tree
+    for element in body.iter(*BLOCK_TAGS):
+        element.tail = "\n" + (element.tail or "")
+    text = _collapse_whitespace(body.text_content(), max_chars)
+    return text, {key: value for key, value in metadata.items() if value is not None}
+
+
+def bs4_extract_page(html: str, max_chars: Optional[int] = None) -> Tuple[str, dict]:
+    from bs4 import BeautifulSoup
+
+    # same output as utils.custom_extractor.
+    soup = BeautifulSoup(html, "html.parser")
+    metadata = {}
+    if title := soup.find("title"):
+        metadata["title"] = title.get_text()
+    if description := soup.find("meta", attrs={"name": "description"}):
+        metadata["description"] = description.get("content", None)
+    if html_tag := soup.find("html"):
+        metadata["language"] = html_tag.get("lang", None)
+    text = soup.get_text()
+    return (text[:max_chars] if max_chars is not None else text), metadata
+
+
+EXTRACTOR_BACKENDS: Dict[str, Callable[..., Tuple[str, dict]]] = {
+    "fast": fast_extract_page,
+    "lxml": lxml_extract_page,
+    "bs4": bs4_extract_page,
+}
+
+# lxml is optional, the pure python tokenizer is the fallback.
+_backend = os.getenv("HTML_EXTRACTOR") or (
+    "lxml" if importlib.util.find_spec("lxml") else "fast"
+)
+_processes = int(os.getenv("HTML_EXTRACTOR_PROCESSES", "0"))
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def configure_extractor(
+    backend: Optional[str] = None, processes: Optional[int] = None
+) -> None:
+    """Select the default backend and the number of worker processes (0 extracts on the calling thread)."""
+    global _backend, _processes, _process_pool
+    if backend is not None:
+        if backend not in EXTRACTOR_BACKENDS:
+            raise KeyError(f"{backend} has to be present in {list(EXTRACTOR_BACKENDS)}")
+        _backend = backend
+    if processes is not None:
+        _processes = processes
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False)
+            _process_pool = None
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=_processes)
+    return _process_pool
+
+
+def extract_page(
+    html: str, max_chars: Optional[int] = None, backend: Optional[str] = None
+) -> Tuple[str, dict]:
+    """Visible text of the page (capped at 'max_chars') along with its title, description and language."""
+    return EXTRACTOR_BACKENDS[backend or _backend](html, max_chars)
+
+
+def get_extractor(
+    backend: Optional[str] = None, max_chars: Optional[int] = None
+) -> Callable[[str], str]:
+    """Text only extractor, usable as RecursiveUrlLoader(extractor=...). Picklable for process pools."""
+    return partial(_extract_text, backend=backend or _backend, max_chars=max_chars)
+
+
+def _extract_text(html: str, backend: str, max_chars: Optional[int]) -> str:
+    return EXTRACTOR_BACKENDS[backend](html, max_chars)[0]
+
+
+async def aextract_page(
+    html: str, max_chars: Optional[int] = None, backend: Optional[str] = None
+) -> Tuple[str, dict]:
+    """extract_page, offloaded to the process pool when one is configured."""
+    if _processes <= 0:
+        return extract_page(html, max_chars=max_chars, backend=backend)
+    return await asyncio.get_running_loop().run_in_executor(
+        _get_process_pool(), extract_page, html, max_chars, backend or _backend
+    )
+
+
+def extract_many(
+    htmls: Iterable[str],
+    max_chars: Optional[int] = None,
+    backend: Optional[str] = None,
+    processes: Optional[int] = None,
+) -> List[str]:
+    """Extract a batch of pages, in parallel over 'processes' worker processes."""
+    extractor = get_extractor(backend=backend, max_chars=max_chars)
+    processes = _processes if processes is None else processes
+    if processes <= 0:
+        return [extractor(html) for html in htmls]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(extractor, htmls, chunksize=4))
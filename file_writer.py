@@ -0,0 +1,46 @@
+import atexit
+import queue
+import logging
+import threading
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class FileWriter:
+    """Background thread running file writes (trajectory logs and blobs, trace spans) in
+    submission order, so the event loop never waits on the disk.
+
+    A reader of the written files calls 'flush' first. The pending writes are flushed at exit.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def submit(self, write: Callable[..., Any], *args: Any):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name=self.name, daemon=True
+                )
+                self._thread.start()
+        self._queue.put((write, args))
+
+    def _run(self):
+        while True:
+            write, args = self._queue.get()
+            try:
+                write(*args)
+            except Exception:
+                # a failed write loses that entry only, the following ones go on.
+                logger.exception("%s: write failed", self.name)
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """Wait for the writes submitted so far."""
+        self._queue.join()
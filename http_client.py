@@ -0,0 +1,87 @@
+import asyncio
+import weakref
+from typing import Any, Dict
+import aiohttp
+from pydantic import BaseModel
+from pydantic.fields import Field
+
+
+class HTTPClientConfig(BaseModel):
+    """Connection pool settings shared by every tool making HTTP calls."""
+
+    limit: int = Field(100, description="Max open connections in the pool.")
+    limit_per_host: int = Field(8, description="Max open connections per host.")
+    keepalive_timeout: float = Field(
+        30.0, description="Seconds an idle connection is kept alive."
+    )
+    total_timeout: float = Field(30.0, description="Timeout of a whole request.")
+    connect_timeout: float = Field(10.0, description="Timeout to open a connection.")
+    verify_ssl: bool = Field(
+        False,
+        description="Websites may have invalid SSL certificates, so like RecursiveUrlLoader we don't verify by default.",
+    )
+    headers: Dict[str, str] = Field(
+        {"User-Agent": "Mozilla/5.0 (compatible; agents-tutorial/1.0)"}
+    )
+
+
+_config = HTTPClientConfig()
+
+# aiohttp sessions are bound to the event loop they were created in, so keep one pool per loop.
+_sessions: (
+    "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]"
+) = weakref.WeakKeyDictionary()
+
+
+def configure_http_client(**kwargs) -> HTTPClientConfig:
+    """Update the pool settings. Applies to sessions created after this call."""
+    global _config
+    _config = _config.model_copy(update=kwargs)
+    return _config
+
+
+def get_session() -> aiohttp.ClientSession:
+    """Pooled session of the running event loop, created on first use."""
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=_config.limit,
+            limit_per_host=_config.limit_per_host,
+            keepalive_timeout=_config.keepalive_timeout,
+            ssl=None if _config.verify_ssl else False,
+        )
+        session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(
+                total=_config.total_timeout, connect=_config.connect_timeout
+            ),
+            headers=_config.headers,
+        )
+        _sessions[loop] = session
+    return session
+
+
+async def close_session():
+    """Close the pooled session of the running event loop. Call it before the loop shuts down."""
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
+
+
+async def fetch_text(url: str, **kwargs) -> tuple[int, Dict[str, str], str]:
+    async with get_session().get(url, **kwargs) as response:
+        text = await response.text(errors="replace")
+        return response.status, dict(response.headers), text
+
+
+async def post_json(url: str, payload: Dict[str, Any], **kwargs) -> Any:
+    async with get_session().post(url, json=payload, **kwargs) as response:
+        if response.status != 200:
+            raise aiohttp.ClientResponseError(
+                response.request_info,
+                response.history,
+                status=response.status,
+                message=response.reason or "",
+            )
+        return await response.json(content_type=None)
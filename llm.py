@@ -0,0 +1,352 @@
+import os
+import json
+import asyncio
+import hashlib
+import time
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Optional, Union
+import dspy
+from pydantic import TypeAdapter
+from cache import LRUCache, SQLiteCache, TieredCache
+from scheduler import Priority, get_scheduler
+from runtime_config import ensure_runtime
+from deadline import with_deadline
+from prompt_budget import count_tokens
+from replay import MISSING, record_call, replayed
+from trajectory_store import to_jsonable
+from tracing import Span, current_span, get_tracer
+from llm_stream import FieldTextStream, StreamChunk, StreamingLM, field_text
+
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+DEFAULT_LLM_CACHE_PATH = os.getenv(
+    "LLM_CACHE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "agents_tutorial", "llm.sqlite3"),
+)
+DEFAULT_LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+
+
+class LLMExecutor:
+    """Runs the blocking dspy predictors on a bounded thread pool, so the event loop stays free
+    while the LLM round-trip is in flight. 'max_concurrency' caps the in-flight LLM calls of the process.
+    """
+
+    def __init__(self, max_concurrency: int = DEFAULT_MAX_CONCURRENCY):
+        if max_concurrency < 1:
+            raise ValueError(f"max_concurrency has to be >= 1, got {max_concurrency}")
+        self.max_concurrency = max_concurrency
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="dspy-llm"
+        )
+
+    @staticmethod
+    def _call(predictor: dspy.Module, config: dict, kwargs: dict):
+        # dspy settings are thread-local, so replay the caller's config (lm, trace, ...) in the worker thread.
+        with dspy.settings.context(inherit_config=False, **config):
+            return predictor(**kwargs)
+
+    async def run(self, predictor: dspy.Module, **kwargs) -> dspy.Prediction:
+        return await self.run_with_config(predictor, kwargs)
+
+    async def run_with_config(
+        self, predictor: dspy.Module, kwargs: dict, **config_overrides
+    ) -> dspy.Prediction:
+        """'run' with dspy settings (e.g. 'lm') overridden for this call only."""
+        loop = asyncio.get_running_loop()
+        config = {**dspy.settings.config, **config_overrides}
+        call = functools.partial(
+            contextvars.copy_context().run, self._call, predictor, config, kwargs
+        )
+        return await loop.run_in_executor(self._pool, call)
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
+
+
+_executor: Optional[LLMExecutor] = None
+
+
+def get_llm_executor() -> LLMExecutor:
+    global _executor
+    if _executor is None:
+        _executor = LLMExecutor()
+    return _executor
+
+
+def set_max_concurrency(max_concurrency: int) -> LLMExecutor:
+    """Replace the process wide executor. In-flight calls on the old executor are allowed to finish."""
+    global _executor
+    old_executor, _executor = _executor, LLMExecutor(max_concurrency=max_concurrency)
+    if old_executor is not None:
+        old_executor.shutdown(wait=False)
+    return _executor
+
+
+_llm_cache: Optional[TieredCache] = None
+_llm_cache_enabled = os.getenv("LLM_CACHE", "1") != "0"
+
+
+def configure_llm_cache(
+    enabled: bool = True,
+    path: Optional[str] = DEFAULT_LLM_CACHE_PATH,
+    ttl: Optional[float] = DEFAULT_LLM_CACHE_TTL,
+    max_memory_entries: int = 1024,
+    max_disk_bytes: int = 256 * 1024 * 1024,
+) -> Optional[TieredCache]:
+    """(Re)build the LLM response cache. 'path=None' keeps only the in-memory tier."""
+    global _llm_cache, _llm_cache_enabled
+    _llm_cache_enabled = enabled
+    _llm_cache = (
+        TieredCache(
+            memory=LRUCache(max_entries=max_memory_entries, ttl=ttl),
+            disk=(
+                SQLiteCache(path=path, ttl=ttl, max_bytes=max_disk_bytes)
+                if path
+                else None
+            ),
+        )
+        if enabled
+        else None
+    )
+    return _llm_cache
+
+
+def get_llm_cache() -> Optional[TieredCache]:
+    if _llm_cache is None and _llm_cache_enabled:
+        configure_llm_cache()
+    return _llm_cache
+
+
+def llm_cache_key(predictor: dspy.Module, kwargs: dict) -> str:
+    """Content address of a predictor call: signature, inputs and the configured LM."""
+    lm = dspy.settings.lm
+    payload = {
+        "signature": repr(getattr(predictor, "signature", predictor)),
+        "inputs": to_jsonable(kwargs),
+        "lm": {
+            "class": type(lm).__name__,
+            "provider": getattr(lm, "provider", None),
+            "kwargs": to_jsonable(getattr(lm, "kwargs", {})),
+        },
+    }
+    return hashlib.sha256(
+        json.dumps(payload, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+def _dump_prediction(prediction: dspy.Prediction) -> str:
+    return json.dumps({key: to_jsonable(prediction[key]) for key in prediction.keys()})
+
+
+def _load_prediction(predictor: dspy.Module, value: str) -> dspy.Prediction:
+    signature = getattr(predictor, "signature", None)
+    output_fields = signature.output_fields if signature is not None else {}
+    fields = {}
+    for key, item in json.loads(value).items():
+        field = output_fields.get(key)
+        fields[key] = (
+            TypeAdapter(field.annotation).validate_python(item)
+            if field is not None
+            else item
+        )
+    return dspy.Prediction(**fields)
+
+
+def estimate_tokens(kwargs: dict) -> int:
+    # the prompt budget estimate over the JSON encoded inputs, good enough for rate limiting.
+    return count_tokens(json.dumps(to_jsonable(kwargs)))
+
+
+class _UsageLM:
+    """Counts the LM round-trips of a predictor call (typed predictor retries included) and their
+    prompt/completion tokens on the call's span.
+    """
+
+    def __init__(self, lm: Any, span: Span):
+        self.lm = lm
+        self.span = span
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.lm, name)
+
+    def __call__(self, prompt: str, **kwargs) -> list:
+        completions = self.lm(prompt, **kwargs)
+        self.span.add(
+            lm_calls=1,
+            prompt_tokens=count_tokens(prompt),
+            completion_tokens=sum(
+                count_tokens(
+                    completion["text"] if isinstance(completion, dict) else completion
+                )
+                for completion in completions
+            ),
+        )
+        return completions
+
+
+def _predictor_name(predictor: dspy.Module) -> str:
+    # typed predictors rebuild their signature (as "StringSignature"), the outputs name the call.
+    signature = getattr(predictor, "signature", None)
+    if signature is None:
+        return type(predictor).__name__
+    outputs = [name for name in signature.output_fields if name != "reasoning"]
+    return "+".join(outputs) or signature.__name__
+
+
+async def _replayed_or_cached(
+    key: str, llm_cache: Optional[TieredCache], span: Span
+) -> Optional[str]:
+    """Dumped prediction of the call from the current replay, else from the LLM cache."""
+    recorded = replayed("llm", key)
+    if recorded is not MISSING:
+        span.set(replayed=True)
+        return recorded
+    cached = await llm_cache.aget(key) if llm_cache is not None else None
+    span.set(cache_hit=cached is not None)
+    return cached
+
+
+async def _run_scheduled(
+    predictor: dspy.Module, priority: int, kwargs: dict, **config_overrides
+) -> dspy.Prediction:
+    span = current_span.get()
+    if span is not None:
+        config_overrides["lm"] = _UsageLM(
+            config_overrides.get("lm", dspy.settings.lm), span
+        )
+    # bounded by the deadline of the request, the worker thread finishes the call but nobody waits for it.
+    return await with_deadline(
+        get_scheduler().run(
+            getattr(dspy.settings.lm, "provider", "default"),
+            lambda: get_llm_executor().run_with_config(
+                predictor, kwargs, **config_overrides
+            ),
+            priority=priority,
+            tokens=estimate_tokens(kwargs),
+        )
+    )
+
+
+async def apredict(
+    predictor: dspy.Module, priority: int = Priority.NORMAL, **kwargs
+) -> dspy.Prediction:
+    """Await a dspy predictor (TypedChainOfThought, assertion wrapped modules, ...) without blocking the event loop.
+
+    Responses are served from / stored in the LLM cache when it is enabled, its disk tier is used
+    from a worker thread. Cache misses go through
+    the scheduler in the lane of 'priority'.
+    """
+    ensure_runtime()
+    with get_tracer().span(
+        f"llm.{_predictor_name(predictor)}",
+        "llm",
+        input_bytes=len(json.dumps(to_jsonable(kwargs))),
+    ) as span:
+        llm_cache = get_llm_cache()
+        key = llm_cache_key(predictor, kwargs)
+        cached = await _replayed_or_cached(key, llm_cache, span)
+        if cached is not None:
+            record_call("llm", key, cached)
+            span.set(output_bytes=len(cached))
+            return _load_prediction(predictor, cached)
+
+        prediction = await _run_scheduled(predictor, priority, kwargs)
+        dumped = _dump_prediction(prediction)
+        record_call("llm", key, dumped)
+        span.set(output_bytes=len(dumped))
+        if llm_cache is not None:
+            await llm_cache.aset(key, dumped)
+        return prediction
+
+
+async def astream_predict(
+    predictor: dspy.Module,
+    field: str,
+    json_key: Optional[str] = None,
+    priority: int = Priority.NORMAL,
+    **kwargs,
+) -> AsyncIterator[Union[StreamChunk, dspy.Prediction]]:
+    """'apredict' streaming the text of the output 'field' while the LM generates it.
+
+    Yields StreamChunk objects, then the parsed prediction. 'json_key' picks the string to stream
+    out of a JSON typed field. A cached response is yielded as a single chunk.
+    """
+    ensure_runtime()
+    # an async generator can be suspended at any yield, so its span is not made current
+    # (the LLM call below is the only thing running under it).
+    tracer = get_tracer()
+    parent = current_span.get()
+    span = tracer.start_span(
+        f"llm.{_predictor_name(predictor)}",
+        "llm",
+        input_bytes=len(json.dumps(to_jsonable(kwargs))),
+        streamed=True,
+    )
+    current_span.set(parent)
+    error = None
+    try:
+        llm_cache = get_llm_cache()
+        key = llm_cache_key(predictor, kwargs)
+        cached = await _replayed_or_cached(key, llm_cache, span)
+        if cached is not None:
+            record_call("llm", key, cached)
+            span.set(output_bytes=len(cached))
+            prediction = _load_prediction(predictor, cached)
+            text = field_text(prediction, field, json_key)
+            yield StreamChunk(delta=text, text=text)
+            yield prediction
+            return
+
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        prefix = predictor.signature.output_fields[field].json_schema_extra["prefix"]
+
+        def on_text(delta: str, new_call: bool):
+            # called from the executor thread.
+            loop.call_soon_threadsafe(queue.put_nowait, (delta, new_call))
+
+        lm = StreamingLM(dspy.settings.lm, on_text)
+        task = asyncio.create_task(
+            _run_scheduled(predictor, priority, kwargs, lm=lm),
+            context=_span_context(span),
+        )
+        # queued after the last piece of text, the executor hands both over through the loop.
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+        attempt, stream = -1, None
+        try:
+            while (item := await queue.get()) is not None:
+                delta, new_call = item
+                if new_call:
+                    attempt, stream = attempt + 1, FieldTextStream(prefix, json_key)
+                    continue
+                if "time_to_first_chunk_seconds" not in span.attributes:
+                    span.set(time_to_first_chunk_seconds=time.time() - span.start_time)
+                delta = stream.feed(delta)
+                if delta:
+                    yield StreamChunk(delta=delta, text=stream.text, attempt=attempt)
+            prediction = task.result()
+        finally:
+            task.cancel()
+
+        dumped = _dump_prediction(prediction)
+        record_call("llm", key, dumped)
+        span.set(output_bytes=len(dumped))
+        if llm_cache is not None:
+            await llm_cache.aset(key, dumped)
+        yield prediction
+    except GeneratorExit:
+        # the consumer stopped reading, not an error of the call.
+        span.set(closed_early=True)
+        raise
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        tracer.end_span(span, error=error)
+
+
+def _span_context(span: Span) -> contextvars.Context:
+    context = contextvars.copy_context()
+    context.run(current_span.set, span)
+    return context
@@ -0,0 +1,198 @@
+import json
+import re
+from typing import Any, Callable, List, Optional
+from pydantic import BaseModel
+from pydantic.fields import Field
+
+_JSON_ESCAPES = {
+    '"': '"',
+    "\\": "\\",
+    "/": "/",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+}
+
+
+class StreamChunk(BaseModel):
+    """Partial text of the streamed output field."""
+
+    delta: str = Field("", description="Text added since the previous chunk.")
+    text: str = Field("", description="Text of the field so far.")
+    attempt: int = Field(
+        0,
+        description="LM call the text belongs to. A new attempt (the typed predictor retrying a completion it could not parse) starts the text over.",
+    )
+
+
+class FieldTextStream:
+    """Incrementally pulls the text of one output field out of a dspy completion.
+
+    The field starts after its 'prefix' (e.g. 'Final Response:'). For JSON typed fields 'json_key'
+    selects the string value to stream (e.g. 'answer' of '{"answer": "..."}').
+    """
+
+    def __init__(self, prefix: str, json_key: Optional[str] = None):
+        self.prefix = prefix
+        self.key_pattern = (
+            re.compile(rf'"{re.escape(json_key)}"\s*:\s*"') if json_key else None
+        )
+        self.text = ""
+        self._buffer = ""
+        self._position = 0
+        self._phase = "prefix"
+
+    def feed(self, chunk: str) -> str:
+        """Add a piece of the completion, return the new text of the field."""
+        self._buffer += chunk
+        if self._phase == "prefix":
+            index = self._buffer.find(self.prefix, self._position)
+            if index == -1:
+                # the prefix may be cut in two by the chunking.
+                self._position = max(0, len(self._buffer) - len(self.prefix))
+                return ""
+            self._position = index + len(self.prefix)
+            self._phase = "key" if self.key_pattern else "leading_space"
+        if self._phase == "key":
+            match = self.key_pattern.search(self._buffer, self._position)
+            if match is None:
+                return ""
+            self._position = match.end()
+            self._phase = "value"
+        if self._phase == "leading_space":
+            while (
+                self._position < len(self._buffer)
+                and self._buffer[self._position].isspace()
+            ):
+                self._position += 1
+            if self._position == len(self._buffer):
+                return ""
+            self._phase = "text"
+
+        if self._phase == "text":
+            delta = self._buffer[self._position :]
+            self._position = len(self._buffer)
+        elif self._phase == "value":
+            delta = self._decode_json_string()
+        else:
+            delta = ""
+        self.text += delta
+        return delta
+
+    def _decode_json_string(self) -> str:
+        decoded = []
+        buffer, position = self._buffer, self._position
+        while position < len(buffer):
+            char = buffer[position]
+            if char == '"':
+                self._phase = "done"
+                position += 1
+                break
+            if char != "\\":
+                decoded.append(char)
+                position += 1
+                continue
+            # escape sequences are decoded once complete.
+            if position + 1 >= len(buffer):
+                break
+            escape = buffer[position + 1]
+            if escape == "u":
+                if position + 6 > len(buffer):
+                    break
+                decoded.append(json.loads(f'"{buffer[position:position + 6]}"'))
+                position += 6
+            else:
+                decoded.append(_JSON_ESCAPES.get(escape, escape))
+                position += 2
+        self._position = position
+        return "".join(decoded)
+
+
+class StreamingLM:
+    """Wraps the configured dspy LM so that completions are streamed to 'on_text(delta, new_call)'.
+
+    OpenAI chat models are called with 'stream=True'. Any other LM is called as usual and its
+    completion is handed over in one piece. dspy keeps seeing a regular LM (kwargs, history, ...).
+    """
+
+    def __init__(self, lm: Any, on_text: Callable[[str, bool], None]):
+        self.lm = lm
+        self.on_text = on_text
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.lm, name)
+
+    def _stream_openai_chat(self, prompt: str, **kwargs) -> List[str]:
+        import openai
+
+        raw_kwargs = kwargs
+        kwargs = {**self.lm.kwargs, **kwargs, "n": 1, "stream": True}
+        kwargs.pop("model_type", None)
+        messages = [{"role": "user", "content": prompt}]
+        if getattr(self.lm, "system_prompt", None):
+            messages.insert(0, {"role": "system", "content": self.lm.system_prompt})
+
+        parts = []
+        finish_reason = None
+        for chunk in openai.chat.completions.create(messages=messages, **kwargs):
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            if choice.delta.content:
+                parts.append(choice.delta.content)
+                self.on_text(choice.delta.content, False)
+            finish_reason = choice.finish_reason or finish_reason
+
+        text = "".join(parts)
+        # same shape as the non streaming history, so inspect_history keeps working.
+        self.lm.history.append(
+            {
+                "prompt": prompt,
+                "response": {
+                    "choices": [
+                        {
+                            "message": {"role": "assistant", "content": text},
+                            "finish_reason": finish_reason,
+                        }
+                    ]
+                },
+                "kwargs": kwargs,
+                "raw_kwargs": raw_kwargs,
+            }
+        )
+        return [text]
+
+    def __call__(self, prompt: str, **kwargs) -> List[Any]:
+        self.on_text("", True)
+        if (
+            getattr(self.lm, "provider", None) == "openai"
+            and getattr(self.lm, "model_type", None) == "chat"
+            and kwargs.get("n", self.lm.kwargs.get("n", 1)) == 1
+            and not kwargs.get("logprobs")
+        ):
+            kwargs.pop("only_completed", None)
+            kwargs.pop("return_sorted", None)
+            return self._stream_openai_chat(prompt, **kwargs)
+
+        completions = self.lm(prompt, **kwargs)
+        if completions:
+            completion = completions[0]
+            self.on_text(
+                completion["text"] if isinstance(completion, dict) else completion,
+                False,
+            )
+        return completions
+
+
+def field_text(prediction: Any, field: str, json_key: Optional[str] = None) -> str:
+    """Final text of the streamed field, read from a parsed prediction."""
+    value = prediction[field]
+    if json_key is None:
+        return value if isinstance(value, str) else str(value)
+    if isinstance(value, BaseModel):
+        return getattr(value, json_key)
+    if isinstance(value, dict):
+        return value[json_key]
+    return str(value)
@@ -0,0 +1,138 @@
+import re
+import math
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+from pydantic import BaseModel
+from pydantic.fields import Field
+
+DEFAULT_PASSAGE_CHARS = 800
+_WORD_PATTERN = re.compile(r"\w+")
+_SENTENCE_END_PATTERN = re.compile(r"(?<=[.!?])\s+")
+STOPWORDS = frozenset(
+    """a an and are as at be been but by can do does for from has have how i if in into is it its
+    of on or our so such than that the their them then there these they this to was we were what
+    when where which who why will with you your""".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [
+        word
+        for word in _WORD_PATTERN.findall(text.lower())
+        if len(word) > 1 and word not in STOPWORDS
+    ]
+
+
+class Passage(BaseModel):
+    source: int = Field(
+        ..., description="Index of the document the passage comes from."
+    )
+    position: int = Field(..., description="Index of the passage in its document.")
+    text: str = Field("", description="Text of the passage.")
+    score: float = Field(0.0, description="Relevance to the query.")
+
+
+def split_passages(text: str, max_chars: int = DEFAULT_PASSAGE_CHARS) -> List[str]:
+    """Split on paragraphs, packing short ones together and cutting long ones on sentences."""
+    passages, current = [], ""
+    for paragraph in re.split(r"\n\s*\n|\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        pieces = (
+            [paragraph]
+            if len(paragraph) <= max_chars
+            else _SENTENCE_END_PATTERN.split(paragraph)
+        )
+        for piece in pieces:
+            while len(piece) > max_chars:
+                passages.append(piece[:max_chars])
+                piece = piece[max_chars:]
+            if current and len(current) + len(piece) + 1 > max_chars:
+                passages.append(current)
+                current = ""
+            current = f"{current}\n{piece}" if current else piece
+    if current:
+        passages.append(current)
+    return passages
+
+
+class BM25:
+    """Okapi BM25 over a small in-memory corpus of tokenized passages."""
+
+    def __init__(
+        self, documents: Iterable[List[str]], k1: float = 1.5, b: float = 0.75
+    ):
+        self.k1, self.b = k1, b
+        self.term_frequencies = [Counter(tokens) for tokens in documents]
+        self.lengths = [sum(counts.values()) for counts in self.term_frequencies]
+        self.average_length = (
+            sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        )
+        document_frequencies: Counter = Counter()
+        for counts in self.term_frequencies:
+            document_frequencies.update(counts.keys())
+        count = len(self.term_frequencies)
+        self.idf: Dict[str, float] = {
+            term: math.log(1 + (count - frequency + 0.5) / (frequency + 0.5))
+            for term, frequency in document_frequencies.items()
+        }
+
+    def scores(self, query: List[str]) -> List[float]:
+        query_terms = [term for term in set(query) if term in self.idf]
+        scores = []
+        for counts, length in zip(self.term_frequencies, self.lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / (self.average_length or 1))
+            score = 0.0
+            for term in query_terms:
+                frequency = counts.get(term)
+                if frequency:
+                    score += (
+                        self.idf[term] * frequency * (self.k1 + 1) / (frequency + norm)
+                    )
+            scores.append(score)
+        return scores
+
+
+def select_passages(
+    query: str,
+    documents: List[str],
+    max_chars: int,
+    top_k: Optional[int] = None,
+    passage_chars: int = DEFAULT_PASSAGE_CHARS,
+) -> List[Passage]:
+    """Rank the passages of 'documents' against 'query' with BM25 and keep the best ones within
+    'max_chars' (and 'top_k'). The selection is returned in document order.
+    """
+    passages = [
+        Passage(source=source, position=position, text=text)
+        for source, document in enumerate(documents)
+        for position, text in enumerate(split_passages(document, passage_chars))
+    ]
+    if not passages:
+        return []
+    scores = BM25([tokenize(passage.text) for passage in passages]).scores(
+        tokenize(query)
+    )
+    # ties (e.g. a query without any known term) keep the original order, i.e. the top of the pages.
+    ranked = sorted(range(len(passages)), key=lambda index: (-scores[index], index))
+
+    selected, size = [], 0
+    for index in ranked:
+        if top_k is not None and len(selected) >= top_k:
+            break
+        passage = passages[index]
+        if size + len(passage.text) > max_chars:
+            continue
+        passage.score = scores[index]
+        selected.append(passage)
+        size += len(passage.text)
+    return sorted(selected, key=lambda passage: (passage.source, passage.position))
+
+
+def group_by_source(passages: List[Passage]) -> List[Tuple[int, str]]:
+    """(source, text) per document, its selected passages joined in order."""
+    grouped: Dict[int, List[str]] = {}
+    for passage in passages:
+        grouped.setdefault(passage.source, []).append(passage.text)
+    return [(source, "\n...\n".join(texts)) for source, texts in grouped.items()]
@@ -1,25 +1,37 @@
 import dspy
 from pydantic import BaseModel, Field
-from typing import Optional, List
-from dotenv import load_dotenv
+from typing import AsyncIterator, Optional, List, Literal
 from agent import Agent, preprocessAgent
 from search_agent import SearchAgent
-from langchain_core.prompts import PromptTemplate
+from agent_pool import get_agent_pool
 from action import Action
 from tools_agents_selection import GivenTaskAndContext
 
 from dspy.primitives.assertions import assert_transform_module, backtrack_handler
 from functools import partial
+from contextlib import aclosing
+import contextvars
 import asyncio
-from trajectory import Trajectory, State
-from utils import transform_schema_args_type
-
-
-load_dotenv()
-gpt_3 = dspy.OpenAI(model="gpt-4o-2024-05-13", max_tokens=4000, temperature=0)
-
-dspy.configure(lm=gpt_3)
-
+import logging
+import re
+from trajectory import Trajectory, State, collected_trajectories, current_trajectory
+from utils import schema_args_type
+from llm import apredict
+from scheduler import Priority
+from http_client import close_session
+from runtime_config import configure_runtime
+from url_registry import url_registry_scope
+from tracing import get_tracer
+from deadline import deadline_scope, describe_error, remaining, with_deadline
+
+# the LM is configured on first use (or explicitly) through runtime_config.
+
+logger = logging.getLogger(__name__)
+
+# share of the remaining time given to the slides, the review gets the rest.
+SLIDES_DEADLINE_SHARE = 0.8
+# decks with more slides are reviewed in parallel windows of this many slides.
+REVIEW_WINDOW_SIZE = 5
 
 n_try = partial(backtrack_handler, max_backtracks=5)
 
@@ -91,6 +103,82 @@ class ReviewPresentationSignature(dspy.Signature):
     )
 
 
+_URL_PATTERN = re.compile(r"https?://[^\s)\]>\"']+")
+# only titles that are wholly a reference heading, "Data Sources for Clinical AI" is content.
+_REFERENCE_TITLE_PATTERN = re.compile(
+    r"^\s*(references?|sources?|reference links|further reading)\s*:?\s*$", re.I
+)
+# lines shorter than this (titles, "Benefits:", ...) may legitimately repeat across slides.
+_MIN_DEDUP_LINE_LENGTH = 24
+
+
+def _normalize_line(line: str) -> str:
+    return re.sub(r"[\W_]+", " ", line).strip().lower()
+
+
+def consolidate_presentation(presentation: List[SlideContent]) -> List[SlideContent]:
+    """Cheap cross-slide pass over a deck reviewed window by window (no LLM call).
+
+    Lines repeated on several slides are kept on the first one only, and the reference slides of
+    the windows are merged into a single 'References' slide at the end: their other lines first,
+    then one line per link.
+    """
+    slides, notes, references = [], [], {}
+    seen_lines = set()
+    for slide in presentation:
+        is_reference = _REFERENCE_TITLE_PATTERN.match(slide.title) is not None
+        lines = []
+        for line in slide.content.splitlines():
+            urls = _URL_PATTERN.findall(line) if is_reference else []
+            if urls:
+                references.setdefault(urls[0].rstrip(".,;"), line.strip())
+                continue
+            key = _normalize_line(line)
+            if len(key) >= _MIN_DEDUP_LINE_LENGTH:
+                if key in seen_lines:
+                    continue
+                seen_lines.add(key)
+            lines.append(line)
+        if is_reference:
+            notes.extend(line.strip() for line in lines if line.strip())
+        else:
+            slides.append(
+                SlideContent(title=slide.title, content="\n".join(lines).strip())
+            )
+
+    if notes or references:
+        slides.append(
+            SlideContent(
+                title="References", content="\n".join([*notes, *references.values()])
+            )
+        )
+    return slides
+
+
+class PresentationEvent(BaseModel):
+    """Event streamed by 'PresentationAIAgent.astream'."""
+
+    event: Literal["outline", "slide", "presentation"] = Field(
+        ..., description="Which part of the presentation is ready."
+    )
+    outline: Optional[PresentationOutlineOutput] = Field(
+        None, description="Outline of the presentation, for the 'outline' event."
+    )
+    index: Optional[int] = Field(
+        None, description="Position of the slide in the outline, for the 'slide' event."
+    )
+    slide: Optional[SlideContent] = Field(
+        None, description="Generated slide, for the 'slide' event."
+    )
+    presentation: Optional[List[SlideContent]] = Field(
+        None, description="Reviewed presentation, for the 'presentation' event."
+    )
+    error: Optional[str] = Field(
+        None,
+        description="Error of the failed slide, or of the review for the 'presentation' event.",
+    )
+
+
 class PresentationAIAgent(Agent):
     def __init__(
         self,
@@ -98,13 +186,14 @@ class PresentationAIAgent(Agent):
         role: Optional[str] = None,
         tools: Optional[List] = None,
         team_agents: Optional[List] = None,
+        review_window_size: Optional[int] = REVIEW_WINDOW_SIZE,
     ):
         default_name = "Presentation AI Agent"
         default_role = """You are an expert in building presentation slides. Based on the task given, you research thoroughly using tools and also coordinate with your team_agents whenever required. 
         Build the title of each slide and its content as well. Based on the plans, build each slide with relevant content.
         """
         default_tools = []
-        default_team_agents = [SearchAgent()]
+        default_team_agents = [get_agent_pool().get(SearchAgent)]
 
         Agent.__init__(
             self,
@@ -114,19 +203,18 @@ class PresentationAIAgent(Agent):
             team_agents=team_agents if team_agents else default_team_agents,
         )
 
-        self.args = transform_schema_args_type(self.forward.__annotations__)
-        self.trajectory = None
+        self.args = schema_args_type(type(self).forward)
         self.pre_processesed_fields = preprocessAgent(self)
+        # None reviews the whole deck in a single call.
+        self.review_window_size = review_window_size
 
-        # prompt_template
-        self.slide_prompt = PromptTemplate.from_template(
-            """Generate content of the slide (basically one-pager slide) of the overall presentation based on title and outline provided. If possible please also include the sources (including links) of the content.
+        # prompt_template (str.format template)
+        self.slide_prompt = """Generate content of the slide (basically one-pager slide) of the overall presentation based on title and outline provided. If possible please also include the sources (including links) of the content.
 
             title: {title}
             outline: {outline}
             
             """
-        )
 
         ##Signatures & Modules.
         self._outline_presentation = dspy.TypedChainOfThought(
@@ -138,11 +226,19 @@ class PresentationAIAgent(Agent):
         )
         self._action = Action(preprocessed_fields=self.pre_processesed_fields)
 
-    def build_presentation_outline(
+    @property
+    def trajectory(self) -> Optional[Trajectory]:
+        """Trajectory of the forward call running in the current task/context."""
+        return current_trajectory.get()
+
+    async def build_presentation_outline(
         self, task: str, context: str
     ) -> PresentationOutlineOutput:
-        response = self._outline_presentation(
-            presentation_input=GivenTaskAndContext(task=task, context=context)
+        # the outline and the review are on the critical path of the whole deck.
+        response = await apredict(
+            self._outline_presentation,
+            priority=Priority.HIGH,
+            presentation_input=GivenTaskAndContext(task=task, context=context),
         )
         state = State(
             task=GivenTaskAndContext(task=task, context=context),
@@ -160,16 +256,19 @@ class PresentationAIAgent(Agent):
         task_context = GivenTaskAndContext(
             task=task, context=self.pre_processesed_fields.background_story
         )
-        response = await self._action(task=task_context)
-        self.trajectory.add_state(self._action.state)
-        # print(f"Slide content: {response}")
-        return SlideContent(title=slide_outline.title, content=response)
+        state = await self._action.execute(task=task_context)
+        self.trajectory.add_state(state)
+        # print(f"Slide content: {state.response}")
+        return SlideContent(title=slide_outline.title, content=state.response)
 
-    async def review_presentation(
+    async def review_window(
         self, presentation: List[SlideContent]
     ) -> PresentationContent:
-        response = self._review_presentation(
-            current_presentation=PresentationContent(presentation=presentation)
+        """Review the slides in a single call. Assertion retries re-send these slides only."""
+        response = await apredict(
+            self._review_presentation,
+            priority=Priority.HIGH,
+            current_presentation=PresentationContent(presentation=presentation),
         )
 
         dspy.Suggest(
@@ -185,46 +284,203 @@ class PresentationAIAgent(Agent):
         self.trajectory.add_state(state)
         return response.cleaned_presentation
 
-    async def forward(self, task: str, context: Optional[str] = None):
-        context = (
-            self.pre_processesed_fields.background_story + context
-            if context
-            else self.pre_processesed_fields.background_story
-        )
-
-        self.trajectory = Trajectory(
-            task=GivenTaskAndContext(task=task, context=context),
-            resources=self.pre_processesed_fields.tools_and_agents_args_type_formats,
+    async def review_presentation(
+        self, presentation: List[SlideContent]
+    ) -> PresentationContent:
+        window_size = self.review_window_size
+        if not window_size or len(presentation) <= window_size:
+            return await self.review_window(presentation)
+
+        # big decks: the windows are reviewed in parallel, then merged by a cheap cross-slide pass.
+        windows = [
+            presentation[start : start + window_size]
+            for start in range(0, len(presentation), window_size)
+        ]
+        reviews = await asyncio.gather(
+            *[self.review_window(window) for window in windows], return_exceptions=True
         )
-
-        # print(context, self.pre_processesed_fields)
-
-        presentation_outline = self.build_presentation_outline(
-            task=task, context=context
+        reviewed = []
+        for window, review in zip(windows, reviews):
+            if isinstance(review, BaseException):
+                if not isinstance(review, Exception):
+                    raise review
+                # a window failing its retries keeps its slides as generated.
+                logger.warning("review of %d slides failed: %r", len(window), review)
+                reviewed.extend(window)
+            else:
+                reviewed.extend(review.presentation)
+        return PresentationContent(presentation=consolidate_presentation(reviewed))
+
+    async def astream(
+        self, task: str, context: Optional[str] = None, timeout: Optional[float] = None
+    ) -> AsyncIterator[PresentationEvent]:
+        """Yield the outline as soon as it is built, then every slide as it finishes (completion
+        order, with its index in the outline) and finally the reviewed presentation.
+
+        With 'timeout' (or the deadline of the caller) the slides get SLIDES_DEADLINE_SHARE of the
+        remaining time and the review the rest. Slides failing or running out of time are reported
+        with their error and left out, the deck keeps the others.
+        """
+        # the run is a task with its own copy of the caller's context, the generator only relays its
+        # events: the span, deadline and trajectory of the run never reach the consumer, and closing
+        # the generator (from any context) just cancels the task.
+        events: asyncio.Queue = asyncio.Queue()
+        run = asyncio.create_task(
+            self._run(task, context, timeout, events),
+            context=contextvars.copy_context(),
         )
-
-        presentation = await asyncio.gather(
-            *[
-                self.generate_each_slide(slide_outline)
-                for slide_outline in presentation_outline.outline
-            ]
+        # queued after the last event of the run.
+        run.add_done_callback(lambda _: events.put_nowait(None))
+        try:
+            while (event := await events.get()) is not None:
+                yield event
+            run.result()
+        finally:
+            run.cancel()
+
+    async def _run(
+        self,
+        task: str,
+        context: Optional[str],
+        timeout: Optional[float],
+        events: asyncio.Queue,
+    ):
+        """Body of 'astream', putting its events in 'events'."""
+        tracer = get_tracer()
+        span = tracer.start_span(
+            f"agent.{type(self).__name__}", "agent", agent=self.name
         )
+        failure = None
+        try:
+            with deadline_scope(timeout):
+                context = (
+                    self.pre_processesed_fields.background_story + context
+                    if context
+                    else self.pre_processesed_fields.background_story
+                )
+
+                trajectory = Trajectory(
+                    task=GivenTaskAndContext(task=task, context=context),
+                    resources=self.pre_processesed_fields.tools_and_agents_args_type_formats,
+                )
+                current_trajectory.set(trajectory)
+                collected = collected_trajectories.get()
+                if collected is not None:
+                    collected.append(trajectory)
+
+                # print(context, self.pre_processesed_fields)
+
+                presentation_outline = await self.build_presentation_outline(
+                    task=task, context=context
+                )
+                events.put_nowait(
+                    PresentationEvent(event="outline", outline=presentation_outline)
+                )
+
+                async def indexed_slide(index: int, slide_outline: SlideOutline):
+                    try:
+                        return (
+                            index,
+                            await with_deadline(
+                                self.generate_each_slide(slide_outline)
+                            ),
+                            None,
+                        )
+                    except Exception as e:
+                        self.trajectory.add_state(
+                            State(
+                                task=GivenTaskAndContext(task=slide_outline.title),
+                                error=describe_error(e),
+                            )
+                        )
+                        return index, None, describe_error(e)
+
+                # the slides share one url registry, so a url found by several slides is scraped once.
+                # the tasks keep the registry and the deadline of their creation context.
+                time_left = remaining()
+                with url_registry_scope(), deadline_scope(
+                    time_left * SLIDES_DEADLINE_SHARE if time_left is not None else None
+                ):
+                    tasks = [
+                        asyncio.ensure_future(indexed_slide(index, slide_outline))
+                        for index, slide_outline in enumerate(
+                            presentation_outline.outline
+                        )
+                    ]
+                presentation: List[Optional[SlideContent]] = [None] * len(tasks)
+                try:
+                    for next_slide in asyncio.as_completed(tasks):
+                        index, slide, error = await next_slide
+                        presentation[index] = slide
+                        events.put_nowait(
+                            PresentationEvent(
+                                event="slide", index=index, slide=slide, error=error
+                            )
+                        )
+                finally:
+                    # the run was cancelled (the consumer stopped early): the other slides are not needed.
+                    for pending in tasks:
+                        pending.cancel()
+
+                # review presentation.
+                presentation = [slide for slide in presentation if slide is not None]
+                error = None
+                try:
+                    presentation = (
+                        await with_deadline(
+                            self.review_presentation(presentation=presentation)
+                        )
+                    ).presentation
+                except Exception as e:
+                    # out of time or the review failed: the slides are returned as generated.
+                    error = describe_error(e)
+                    self.trajectory.add_state(
+                        State(
+                            task=GivenTaskAndContext(
+                                task=PresentationContent(presentation=presentation)
+                            ),
+                            error=error,
+                        )
+                    )
+                self.trajectory.finish(PresentationContent(presentation=presentation))
+                events.put_nowait(
+                    PresentationEvent(
+                        event="presentation", presentation=presentation, error=error
+                    )
+                )
+        except asyncio.CancelledError:
+            # the consumer stopped reading, not an error of the run.
+            span.set(closed_early=True)
+            raise
+        except BaseException as e:
+            failure = e
+            raise
+        finally:
+            tracer.end_span(span, error=failure)
 
-        # review presentation.
-        presentation_after_review = await self.review_presentation(
-            presentation=presentation
-        )
-        return presentation_after_review.presentation
+    async def forward(self, task: str, context: Optional[str] = None):
+        async with aclosing(self.astream(task=task, context=context)) as events:
+            async for event in events:
+                if event.event == "presentation":
+                    return event.presentation
 
 
 if __name__ == "__main__":
+    configure_runtime()
     agent = PresentationAIAgent()
     # print(gpt_3.inspect_history(n=10))
 
-    y = asyncio.run(
-        agent.forward(
-            task="AI agentic workflow for Healthcare. Its value addition, challenges and how to overcome with the help of network of agents.",
-            context="Generate 3 pager slides.",
-        )
-    )
-    print(y)
+    async def main():
+        try:
+            async with aclosing(
+                agent.astream(
+                    task="AI agentic workflow for Healthcare. Its value addition, challenges and how to overcome with the help of network of agents.",
+                    context="Generate 3 pager slides.",
+                )
+            ) as events:
+                async for event in events:
+                    print(event)
+        finally:
+            await close_session()
+
+    asyncio.run(main())
@@ -0,0 +1,159 @@
+import os
+import json
+import threading
+from typing import Any, List, Optional, Sequence
+from pydantic import BaseModel
+from pydantic.fields import Field
+
+DEFAULT_PROMPT_BUDGET_TOKENS = int(os.getenv("PROMPT_BUDGET_TOKENS", "6000"))
+# search metadata keys worth keeping in a prompt, the rest (content_type, language, ...) is dropped.
+METADATA_KEYS = ("source", "title")
+TRUNCATION_MARKER = " ...[truncated {tokens} tokens]"
+
+
+def count_tokens(text: str) -> int:
+    # ~4 characters per token for english text. The scheduler estimates the LLM calls with it too
+    # (llm.estimate_tokens).
+    return (len(text) + 3) // 4
+
+
+def _compact(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        value = value.model_dump()
+    if isinstance(value, dict):
+        compacted = {}
+        for key, item in value.items():
+            if key == "metadata" and isinstance(item, list):
+                item = [
+                    (
+                        {k: v for k, v in metadata.items() if k in METADATA_KEYS}
+                        if isinstance(metadata, dict)
+                        else metadata
+                    )
+                    for metadata in item
+                ]
+            item = _compact(item)
+            if item not in (None, "", [], {}):
+                compacted[key] = item
+        return compacted
+    if isinstance(value, (list, tuple)):
+        return [_compact(item) for item in value]
+    return value
+
+
+def render_response(response: Any) -> str:
+    """Compact text of a tool/agent response: strings as is, structures as JSON without the
+    empty values and with the search metadata reduced to source and title.
+    """
+    if isinstance(response, str):
+        return response.strip()
+    compacted = _compact(response)
+    if isinstance(compacted, str):
+        return compacted.strip()
+    return json.dumps(compacted, ensure_ascii=False, default=str)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut 'text' to about 'max_tokens' tokens, on a line or word boundary when there is one close by."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    marker = TRUNCATION_MARKER.format(tokens=count_tokens(text) - max_tokens)
+    max_chars = max(0, max_tokens * 4 - len(marker))
+    cut = text[:max_chars]
+    for separator in ("\n", " "):
+        boundary = cut.rfind(separator)
+        if boundary >= max_chars * 0.8:
+            cut = cut[:boundary]
+            break
+    return cut.rstrip() + marker
+
+
+def allocate_budget(sizes: Sequence[int], budget: int) -> List[int]:
+    """Split 'budget' tokens over sections of 'sizes' tokens.
+
+    Sections below their fair share are kept whole and the rest of the budget is shared
+    proportionally to size by the larger ones, so every large section is cut by the same ratio.
+    """
+    allocation = list(sizes)
+    if sum(sizes) <= budget:
+        return allocation
+    remaining_budget, remaining = budget, set(range(len(sizes)))
+    while remaining:
+        share = remaining_budget / len(remaining)
+        small = {index for index in remaining if sizes[index] <= share}
+        if not small:
+            break
+        remaining_budget -= sum(sizes[index] for index in small)
+        remaining -= small
+    total = sum(sizes[index] for index in remaining)
+    for index in remaining:
+        allocation[index] = int(remaining_budget * sizes[index] / total)
+    return allocation
+
+
+class PromptBudgetStats(BaseModel):
+    calls: int = Field(0, description="Calls to 'fit'.")
+    truncated_calls: int = Field(0, description="Calls over the budget.")
+    tokens_in: int = Field(0, description="Tokens of the compacted responses.")
+    tokens_out: int = Field(0, description="Tokens sent to the prompt.")
+    tokens_raw: int = Field(0, description="Tokens of the responses as str().")
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_raw - self.tokens_out
+
+
+class PromptBudgeter:
+    """Per call token budget shared by the tool and agent responses of a prompt."""
+
+    def __init__(self, budget_tokens: int = DEFAULT_PROMPT_BUDGET_TOKENS):
+        self.budget_tokens = budget_tokens
+        self.stats = PromptBudgetStats()
+        self._lock = threading.Lock()
+
+    def fit(
+        self, *groups: Sequence[Any], budget_tokens: Optional[int] = None
+    ) -> List[List[str]]:
+        """Render the responses of every group and fit them, all groups together, in the budget.
+
+        Returns the texts in the same groups and order.
+        """
+        budget = self.budget_tokens if budget_tokens is None else budget_tokens
+        texts = [render_response(response) for group in groups for response in group]
+        sizes = [count_tokens(text) for text in texts]
+        allocation = allocate_budget(sizes, budget)
+        fitted = [
+            truncate_to_tokens(text, max_tokens)
+            for text, max_tokens in zip(texts, allocation)
+        ]
+
+        with self._lock:
+            self.stats.calls += 1
+            self.stats.truncated_calls += sum(sizes) > budget
+            self.stats.tokens_in += sum(sizes)
+            self.stats.tokens_out += sum(count_tokens(text) for text in fitted)
+            self.stats.tokens_raw += sum(
+                count_tokens(str(response)) for group in groups for response in group
+            )
+
+        result, start = [], 0
+        for group in groups:
+            result.append(fitted[start : start + len(group)])
+            start += len(group)
+        return result
+
+
+_prompt_budgeter: Optional[PromptBudgeter] = None
+
+
+def configure_prompt_budgeter(**kwargs) -> PromptBudgeter:
+    global _prompt_budgeter
+    _prompt_budgeter = PromptBudgeter(**kwargs)
+    return _prompt_budgeter
+
+
+def get_prompt_budgeter() -> PromptBudgeter:
+    global _prompt_budgeter
+    if _prompt_budgeter is None:
+        _prompt_budgeter = PromptBudgeter()
+    return _prompt_budgeter
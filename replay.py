@@ -0,0 +1,154 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, Tuple
+from tracing import annotate
+from trajectory import Trajectory, current_trajectory
+from trajectory_store import (
+    Payload,
+    TrajectoryStorage,
+    get_trajectory_storage,
+    to_jsonable,
+)
+
+# result of a call absent from the replay (None is a valid tool result).
+MISSING = object()
+
+
+def _encode_result(value: Any) -> Any:
+    # langchain documents (scraped pages) keep their type through the recording.
+    if hasattr(value, "page_content") and hasattr(value, "metadata"):
+        return {
+            "$document": {
+                "page_content": value.page_content,
+                "metadata": to_jsonable(value.metadata),
+            }
+        }
+    if isinstance(value, (list, tuple)):
+        return [_encode_result(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _encode_result(item) for key, item in value.items()}
+    return to_jsonable(value)
+
+
+def _decode_result(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "$document" in value:
+            from langchain_core.documents import Document
+
+            return Document(**value["$document"])
+        return {key: _decode_result(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode_result(item) for item in value]
+    return value
+
+
+class Replay:
+    """LLM and tool results recorded in a trajectory, by content address: the keys of the LLM cache
+    (signature, inputs and LM config) and of the tool cache (tool name and arguments).
+
+    Within 'replay_scope' every call found here is served from the recording and the others run:
+    a changed prompt or signature, a tool called with other arguments and, in turn, the nodes
+    downstream of a changed output. Like any run, the replaying run records its calls when its
+    trajectory is logged or within 'record_scope'.
+    """
+
+    def __init__(
+        self,
+        calls: Dict[Tuple[str, str], Payload],
+        storage: Optional[TrajectoryStorage] = None,
+    ):
+        self.calls = calls
+        self.storage = storage or get_trajectory_storage()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_trajectory(cls, trajectory: Trajectory) -> "Replay":
+        return cls(
+            {(kind, key): payload for kind, key, payload in trajectory.iter_calls()},
+            storage=trajectory.storage,
+        )
+
+    @classmethod
+    def load(cls, path: str, storage: Optional[TrajectoryStorage] = None) -> "Replay":
+        """Replay of a trajectory log (see Trajectory.load)."""
+        return cls.from_trajectory(Trajectory.load(path, storage=storage))
+
+    def get(self, kind: str, key: str) -> Any:
+        payload = self.calls.get((kind, key), MISSING)
+        if payload is MISSING:
+            self.misses += 1
+            return MISSING
+        self.hits += 1
+        value = self.storage.unpack(payload)
+        return _decode_result(value) if kind == "tool" else value
+
+    def __len__(self) -> int:
+        return len(self.calls)
+
+
+current_replay: ContextVar[Optional[Replay]] = ContextVar(
+    "current_replay", default=None
+)
+# trajectory recording the calls of the block whether it is logged or not (see record_scope).
+current_recording: ContextVar[Optional[Trajectory]] = ContextVar(
+    "current_recording", default=None
+)
+
+
+@contextmanager
+def replay_scope(replay: Optional[Replay]) -> Iterator[Optional[Replay]]:
+    """Serve the LLM and tool calls of the block (and of the tasks it creates) from 'replay'."""
+    token = current_replay.set(replay)
+    try:
+        yield replay
+    finally:
+        current_replay.reset(token)
+
+
+@contextmanager
+def record_scope(trajectory: Trajectory) -> Iterator[Trajectory]:
+    """Record the LLM and tool calls of the block (and of the runs it starts) in 'trajectory', in
+    memory when it has no log. Outside of a scope only the logged trajectories record their calls.
+    """
+    recording_token = current_recording.set(trajectory)
+    trajectory_token = current_trajectory.set(trajectory)
+    try:
+        yield trajectory
+    finally:
+        current_trajectory.reset(trajectory_token)
+        current_recording.reset(recording_token)
+
+
+def replayed(kind: str, key: str) -> Any:
+    """Recorded result of the call in the current replay, MISSING without one."""
+    replay = current_replay.get()
+    return replay.get(kind, key) if replay is not None else MISSING
+
+
+def record_call(kind: str, key: str, value: Any):
+    """Record the result of the call in the current recording, else in the current trajectory
+    when it is logged: kept in memory, the results of every call would grow with the run.
+    """
+    trajectory = current_recording.get()
+    if trajectory is None:
+        trajectory = current_trajectory.get()
+        if trajectory is None or not trajectory.logged:
+            return
+    trajectory.record_call(
+        kind, key, _encode_result(value) if kind == "tool" else value
+    )
+
+
+async def replayed_or_run(
+    kind: str, key: str, call: Callable[[], Awaitable[Any]]
+) -> Any:
+    """Result of the call from the current replay, else of 'call()'. Recorded either way."""
+    recorded = replayed(kind, key)
+    if recorded is not MISSING:
+        annotate(replayed=True)
+        record_call(kind, key, recorded)
+        return recorded
+    result = await call()
+    record_call(kind, key, result)
+    return result
@@ -0,0 +1,74 @@
+import threading
+from typing import Any, Callable, Optional
+from pydantic import BaseModel
+from pydantic.fields import Field
+from dotenv import load_dotenv
+
+
+class RuntimeConfig(BaseModel):
+    """LM configuration applied once per process, on first use unless configured explicitly."""
+
+    model: str = Field("gpt-4o-2024-05-13", description="OpenAI model name.")
+    max_tokens: int = Field(4000, description="Max completion tokens.")
+    temperature: float = Field(0, description="Sampling temperature.")
+
+
+_runtime_config: Optional[RuntimeConfig] = None
+_lock = threading.Lock()
+
+
+def configure_runtime(
+    config: Optional[RuntimeConfig] = None, **overrides
+) -> RuntimeConfig:
+    """Load the .env file, build the OpenAI client and configure dspy with it."""
+    import dspy
+
+    global _runtime_config
+    load_dotenv()
+    config = (config or RuntimeConfig()).model_copy(update=overrides)
+    lm = dspy.OpenAI(
+        model=config.model, max_tokens=config.max_tokens, temperature=config.temperature
+    )
+    dspy.configure(lm=lm)
+    _runtime_config = config
+    return config
+
+
+def ensure_runtime():
+    """Configure the default runtime on first use. An LM configured directly through dspy is kept."""
+    global _runtime_config
+    if _runtime_config is not None:
+        return
+    import dspy
+
+    with _lock:
+        if _runtime_config is None:
+            if dspy.settings.lm is None:
+                configure_runtime()
+            else:
+                _runtime_config = RuntimeConfig(
+                    **{
+                        key: value
+                        for key, value in getattr(
+                            dspy.settings.lm, "kwargs", {}
+                        ).items()
+                        if key in RuntimeConfig.model_fields
+                    }
+                )
+
+
+class LazyClient:
+    """Class attribute building its client on first access, e.g. SDK clients that are slow to import."""
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def __get__(self, obj, objtype=None) -> Any:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    load_dotenv()
+                    self._client = self._factory()
+        return self._client
@@ -0,0 +1,217 @@
+import time
+import heapq
+import random
+import asyncio
+import itertools
+from enum import IntEnum
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from pydantic import BaseModel
+from pydantic.fields import Field
+from tracing import accumulate
+
+
+class Priority(IntEnum):
+    """Lanes of the scheduler, lower value is admitted first."""
+
+    HIGH = 0
+    NORMAL = 10
+    LOW = 20
+
+
+class ProviderLimits(BaseModel):
+    max_in_flight: int = Field(16, description="Max concurrent calls to the provider.")
+    requests_per_minute: Optional[float] = Field(
+        None, description="Token bucket on the number of calls, None for unlimited."
+    )
+    tokens_per_minute: Optional[float] = Field(
+        None,
+        description="Token bucket on the (estimated) LLM tokens, None for unlimited.",
+    )
+    max_retries: int = Field(5, description="Retries of a throttled call.")
+    backoff_base: float = Field(1.0, description="First retry delay in seconds.")
+    backoff_max: float = Field(30.0, description="Max retry delay in seconds.")
+
+
+DEFAULT_PROVIDER_LIMITS = {
+    "openai": ProviderLimits(
+        max_in_flight=16, requests_per_minute=500, tokens_per_minute=300_000
+    ),
+    "tavily": ProviderLimits(max_in_flight=8, requests_per_minute=100),
+    "http": ProviderLimits(max_in_flight=32, max_retries=0),
+}
+
+
+class ProviderStats(BaseModel):
+    calls: int = 0
+    tokens: int = 0
+    throttled: int = 0
+    in_flight: int = 0
+    queue_wait_seconds: float = 0.0
+
+
+class TokenBucket:
+    """Refills 'rate_per_minute' units per minute, holding at most one minute worth of units."""
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = rate_per_minute
+        self.rate = rate_per_minute / 60.0
+        self._available = rate_per_minute
+        self._updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._available = min(
+            self.capacity, self._available + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+
+    async def acquire(self, amount: float = 1.0):
+        amount = min(amount, self.capacity)
+        while True:
+            self._refill()
+            if self._available >= amount:
+                self._available -= amount
+                return
+            await asyncio.sleep((amount - self._available) / self.rate)
+
+
+class PrioritySemaphore:
+    """Semaphore handing free slots to the waiter with the lowest priority value (FIFO within a lane)."""
+
+    def __init__(self, value: int):
+        self._value = value
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+
+    async def acquire(self, priority: int = Priority.NORMAL):
+        if self._value > 0 and not self._waiters:
+            self._value -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # the slot was handed over just before the cancellation, pass it on.
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._value += 1
+
+
+def is_throttling_error(error: Exception) -> bool:
+    for attribute in ("status", "status_code", "http_status"):
+        if getattr(error, attribute, None) == 429:
+            return True
+    message = f"{type(error).__name__} {error}".lower()
+    return any(
+        marker in message for marker in ("ratelimit", "rate limit", "too many requests")
+    )
+
+
+class Scheduler:
+    """Admission control for every LLM and tool call: in-flight caps, rate limits,
+    priority lanes and jittered retries of throttled calls.
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, ProviderLimits]] = None,
+        max_in_flight: int = 64,
+    ):
+        self.limits = {**DEFAULT_PROVIDER_LIMITS, **(limits or {})}
+        self.max_in_flight = max_in_flight
+        self.stats: Dict[str, ProviderStats] = {}
+        self._global = PrioritySemaphore(max_in_flight)
+        self._semaphores: Dict[str, PrioritySemaphore] = {}
+        self._request_buckets: Dict[str, TokenBucket] = {}
+        self._token_buckets: Dict[str, TokenBucket] = {}
+
+    def _provider(self, provider: str) -> ProviderLimits:
+        if provider not in self._semaphores:
+            limits = self.limits.setdefault(provider, ProviderLimits())
+            self._semaphores[provider] = PrioritySemaphore(limits.max_in_flight)
+            if limits.requests_per_minute:
+                self._request_buckets[provider] = TokenBucket(
+                    limits.requests_per_minute
+                )
+            if limits.tokens_per_minute:
+                self._token_buckets[provider] = TokenBucket(limits.tokens_per_minute)
+            self.stats[provider] = ProviderStats()
+        return self.limits[provider]
+
+    @asynccontextmanager
+    async def slot(
+        self, provider: str, priority: int = Priority.NORMAL, tokens: int = 0
+    ):
+        """Hold one in-flight slot of the provider, once its rate limits allow it."""
+        self._provider(provider)
+        stats = self.stats[provider]
+        queued_at = time.monotonic()
+        await self._semaphores[provider].acquire(priority)
+        try:
+            await self._global.acquire(priority)
+            try:
+                if provider in self._request_buckets:
+                    await self._request_buckets[provider].acquire(1)
+                if tokens and provider in self._token_buckets:
+                    await self._token_buckets[provider].acquire(tokens)
+                queue_wait = time.monotonic() - queued_at
+                stats.queue_wait_seconds += queue_wait
+                accumulate(queue_wait_seconds=queue_wait)
+                stats.calls += 1
+                stats.tokens += tokens
+                stats.in_flight += 1
+                try:
+                    yield
+                finally:
+                    stats.in_flight -= 1
+            finally:
+                self._global.release()
+        finally:
+            self._semaphores[provider].release()
+
+    async def run(
+        self,
+        provider: str,
+        call: Callable[[], Awaitable[Any]],
+        priority: int = Priority.NORMAL,
+        tokens: int = 0,
+    ) -> Any:
+        """Run 'call()' through the provider's lane, retrying with jittered backoff when throttled."""
+        limits = self._provider(provider)
+        for attempt in range(limits.max_retries + 1):
+            try:
+                async with self.slot(provider, priority=priority, tokens=tokens):
+                    return await call()
+            except Exception as e:
+                if attempt >= limits.max_retries or not is_throttling_error(e):
+                    raise
+                self.stats[provider].throttled += 1
+                accumulate(throttled=1)
+            delay = min(limits.backoff_max, limits.backoff_base * 2**attempt)
+            await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+
+
+_scheduler: Optional[Scheduler] = None
+
+
+def configure_scheduler(**kwargs) -> Scheduler:
+    global _scheduler
+    _scheduler = Scheduler(**kwargs)
+    return _scheduler
+
+
+def get_scheduler() -> Scheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = Scheduler()
+    return _scheduler
@@ -1,13 +1,34 @@
 import asyncio
+import logging
+from contextlib import aclosing
 import dspy
-from dotenv import load_dotenv
-from typing import List, Optional
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    List,
+    Optional,
+    Union,
+)
 from pydantic import BaseModel
 from pydantic.fields import Field
 from agent import Agent, preprocessAgent
 from tool import WebsiteScrapper, InternetSearch, InternetAnswer
-from utils import transform_schema_args_type
+from utils import schema_args_type
 from action import Action
+from llm import apredict, astream_predict
+from llm_stream import StreamChunk
+from passages import group_by_source, select_passages
+from document_store import get_document_store
+from deadline import describe_error, with_deadline
+from tracing import get_tracer
+from http_client import close_session
+from runtime_config import configure_runtime
+from replay import replayed_or_run
+from tool_cache import ToolCache, get_tool_cache
+from url_registry import current_url_registry, url_registry_scope
 from tools_agents_selection import (
     GivenTaskAndContext,
     SelectedToolsAndAgents,
@@ -15,10 +36,29 @@ from tools_agents_selection import (
     ToolResponse,
 )
 
-load_dotenv()
-gpt_3 = dspy.OpenAI(model="gpt-4o-2024-05-13", max_tokens=4000, temperature=0)
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+# the LM is configured on first use (or explicitly) through runtime_config.
+
+logger = logging.getLogger(__name__)
 
-dspy.configure(lm=gpt_3)
+# max characters kept from each scraped search result.
+SCRAPED_CONTENT_LIMIT = 20000
+# the browsed answers keep the passages of the scraped pages most relevant to the task, within these limits.
+BROWSED_ANSWERS_MAX_CHARS = 8000
+BROWSED_ANSWERS_TOP_K = 12
+# scraping of the search results stops at the first SCRAPE_QUORUM_PAGES pages or SCRAPE_QUORUM_CHARS
+# characters, a url not scraped within SCRAPE_URL_TIMEOUT seconds is skipped.
+SCRAPE_QUORUM_PAGES = 3
+SCRAPE_QUORUM_CHARS = 40000
+SCRAPE_URL_TIMEOUT = 10.0
+# the local document store answers a search on its own with at least LOCAL_SEARCH_MIN_DOCUMENTS pages
+# fetched in the last LOCAL_SEARCH_MAX_AGE seconds, each holding LOCAL_SEARCH_MIN_COVERAGE of the query terms.
+LOCAL_SEARCH_MIN_DOCUMENTS = 3
+LOCAL_SEARCH_MAX_DOCUMENTS = 5
+LOCAL_SEARCH_MIN_COVERAGE = 0.75
+LOCAL_SEARCH_MAX_AGE = 7 * 24 * 3600.0
 
 
 class InternetSearchBrowsedAnswers(BaseModel):
@@ -70,6 +110,9 @@ class SearchAgent(Agent):
         role: Optional[str] = None,
         tools: Optional[List] = None,
         team_agents: Optional[List] = None,
+        scrape_quorum: Optional[int] = SCRAPE_QUORUM_PAGES,
+        scrape_quorum_chars: Optional[int] = SCRAPE_QUORUM_CHARS,
+        scrape_timeout: Optional[float] = SCRAPE_URL_TIMEOUT,
     ):
         default_name = "Internet Search Agent"
         default_role = """As a internet search agent for a given task, your role is to select tool and generate right search query to search on the web (by using tools provided) and generate the correct response."""
@@ -83,9 +126,13 @@ class SearchAgent(Agent):
             tools=tools if tools else default_tools,
             team_agents=team_agents if team_agents else default_team_agents,
         )
-        self.args = transform_schema_args_type(self.forward.__annotations__)
+        self.args = schema_args_type(type(self).forward)
         self.trajectory = None
         self.pre_processesed_fields = preprocessAgent(agent=self)
+        # pipelined scraping, None for each of them waits for every search result.
+        self.scrape_quorum = scrape_quorum
+        self.scrape_quorum_chars = scrape_quorum_chars
+        self.scrape_timeout = scrape_timeout
 
         # signature & modules
         self._action = Action(preprocessed_fields=self.pre_processesed_fields)
@@ -98,113 +145,278 @@ class SearchAgent(Agent):
     ) -> SelectedToolsAndAgents:
         return await self._action.select_right_tools_and_agents(task=task)
 
+    async def scrape_landing_page(self, url: str) -> Optional["Document"]:
+        # only the landing page is used, so stop the crawl at the first page or the character budget.
+        website_scrapper = self.pre_processesed_fields.tools_mapping["website_scrapper"]
+        async with aclosing(
+            website_scrapper._astream(
+                url=url, max_pages=1, max_chars=SCRAPED_CONTENT_LIMIT
+            )
+        ) as documents:
+            async for document in documents:
+                return document
+        return None
+
     async def scrape_url(self, search_result: dict) -> dict:
         url = search_result.get("url", "").strip()
         if url:
-            # scraped_content = website_scrapper.run({"url": url})
-            scraped_content = await self.pre_processesed_fields.tools_mapping[
-                "website_scrapper"
-            ]._arun(**{"url": url})
-            if scraped_content is not None and len(scraped_content) > 0:
-                scraped_content = scraped_content[0]
-                page_content = scraped_content.page_content[:5000]
-                if page_content.strip():
-                    meta_data = scraped_content.metadata
-                    search_result["scraped_content"] = page_content
-                    search_result["metadata"] = meta_data
+            scrape = lambda: get_tool_cache().run(
+                "website_scrapper",
+                {"url": url, "max_pages": 1, "max_chars": SCRAPED_CONTENT_LIMIT},
+                lambda: self.scrape_landing_page(url),
+            )
+            with get_tracer().span("scrape", "scrape", url=url) as span:
+                # within a run, every url is scraped once whichever slide or agent asks for it.
+                url_registry = current_url_registry.get()
+                scraped_content = await (
+                    url_registry.fetch(url, scrape) if url_registry else scrape()
+                )
+                if scraped_content is not None:
+                    page_content = scraped_content.page_content
+                    span.set(output_bytes=len(page_content))
+                    if page_content.strip():
+                        meta_data = scraped_content.metadata
+                        search_result["scraped_content"] = page_content
+                        search_result["metadata"] = meta_data
 
         return search_result
 
     async def scrape_urls(self, search_results: list):
-        search_results = await asyncio.gather(
-            *[self.scrape_url(search_result) for search_result in search_results]
-        )
+        """Scrape the search results concurrently, consuming the pages as they arrive.
+
+        Scraping stops at the quorum, 'scrape_quorum' pages or 'scrape_quorum_chars' characters,
+        and every url has 'scrape_timeout' seconds (less when the request deadline is closer).
+        The stragglers are cancelled and keep no scraped_content.
+        """
+
+        async def scrape(search_result: dict) -> dict:
+            try:
+                await with_deadline(
+                    self.scrape_url(search_result), timeout=self.scrape_timeout
+                )
+            except Exception as e:
+                logger.info(
+                    f"Scraping {search_result.get('url')} failed: {describe_error(e)}"
+                )
+            return search_result
+
+        tasks = [
+            asyncio.ensure_future(scrape(search_result))
+            for search_result in search_results
+        ]
+        n_pages, n_chars = 0, 0
+        try:
+            for next_scrape in asyncio.as_completed(tasks):
+                scraped_content = (await next_scrape).get("scraped_content")
+                if not scraped_content:
+                    continue
+                n_pages, n_chars = n_pages + 1, n_chars + len(scraped_content)
+                if (
+                    self.scrape_quorum is not None and n_pages >= self.scrape_quorum
+                ) or (
+                    self.scrape_quorum_chars is not None
+                    and n_chars >= self.scrape_quorum_chars
+                ):
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
         return search_results
 
     async def formulate_search_answer(
         self, task: GivenTaskAndContext, browsed_answers: str
     ) -> str:
-        response = self._formulate_internet_search_answer(
+        response = await apredict(
+            self._formulate_internet_search_answer,
             browsed_answers=InternetSearchBrowsedAnswers(
                 task=task, browsed_answers=browsed_answers
-            )
+            ),
         )
         return response.search_answer.answer
 
+    async def astream_search_answer(
+        self, task: GivenTaskAndContext, browsed_answers: str
+    ) -> AsyncIterator[Union[StreamChunk, InternetSearchAnswer]]:
+        """'formulate_search_answer' yielding the partial answer while it is generated, then the
+        parsed InternetSearchAnswer.
+        """
+        async for item in astream_predict(
+            self._formulate_internet_search_answer,
+            field="search_answer",
+            json_key="answer",
+            browsed_answers=InternetSearchBrowsedAnswers(
+                task=task, browsed_answers=browsed_answers
+            ),
+        ):
+            yield item if isinstance(item, StreamChunk) else item.search_answer
+
+    def search_local_documents(self, query: str) -> List[dict]:
+        """Search results served by the local document store, when it knows enough recent pages
+        covering the query. Empty otherwise, the internet search is then used.
+        """
+        document_store = get_document_store()
+        if document_store is None:
+            return []
+        documents = document_store.search(
+            query,
+            limit=LOCAL_SEARCH_MAX_DOCUMENTS,
+            min_coverage=LOCAL_SEARCH_MIN_COVERAGE,
+            max_age=LOCAL_SEARCH_MAX_AGE,
+        )
+        if len(documents) < LOCAL_SEARCH_MIN_DOCUMENTS:
+            return []
+        return [
+            {
+                "url": document.metadata.get("source", document.url),
+                "scraped_content": document.text,
+                "metadata": document.metadata,
+            }
+            for document in documents
+        ]
+
+    def build_browsed_answers(
+        self, task: GivenTaskAndContext, search_results: List[dict]
+    ) -> str:
+        """Passages of the scraped pages most relevant to the task (BM25), grouped per search result."""
+        scraped = [
+            (idx, search_result["scraped_content"])
+            for idx, search_result in enumerate(search_results)
+            if search_result.get("scraped_content")
+        ]
+        passages = select_passages(
+            query=task.task,
+            documents=[content for _, content in scraped],
+            max_chars=BROWSED_ANSWERS_MAX_CHARS,
+            top_k=BROWSED_ANSWERS_TOP_K,
+        )
+        return "\n\n".join(
+            [
+                f"Search Response_{scraped[source][0]}:{text}"
+                for source, text in group_by_source(passages)
+            ]
+        )
+
+    async def _replayed_step(
+        self, step: str, args: dict, call: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """Result of a step of the search depending on more than its arguments (store contents,
+        timing), recorded and replayed like a tool call but never cached.
+        """
+        return await replayed_or_run(
+            "tool", ToolCache.key(f"{type(self).__name__}.{step}", args), call
+        )
+
     async def run_internet_search(
         self, tool: ToolWithArgsValues, task: GivenTaskAndContext
     ) -> ToolResponse:
         # this is specifically built for running internet_search tool.
-
-        search_results = await self.pre_processesed_fields.tools_mapping[
-            tool.tool_name
-        ]._arun(**tool.argument_values)
-
-        if len(search_results) > 0:
-            search_results = await self.scrape_urls(search_results=search_results)
-            metadata = [x["metadata"] for x in search_results if x.get("metadata")]
-            browsed_answers = "\n\n".join(
-                [
-                    f"Search Response_{idx}:{search_result['scraped_content'][:5000]}"
-                    for idx, search_result in enumerate(search_results)
-                    if search_result.get("scraped_content")
-                ]
+        with get_tracer().span("tool.internet_search", "tool") as span:
+            query = tool.argument_values.get("query") or task.task
+            # the store changes between runs: a replay uses the recorded documents.
+            search_results = await self._replayed_step(
+                "local_documents",
+                {"query": query},
+                lambda: asyncio.to_thread(self.search_local_documents, query=query),
             )
-            search_answer = await self.formulate_search_answer(
-                task=task, browsed_answers=browsed_answers
-            )
-            response = {"search_answer": search_answer, "metadata": metadata}
-        else:
-            response = "No response from Internet Search Tool !!"
+            span.set(local_documents=len(search_results))
+            if not search_results:
+                search_results = await get_tool_cache().arun(
+                    self.pre_processesed_fields.tools_mapping[tool.tool_name],
+                    **tool.argument_values,
+                )
+                if isinstance(search_results, list) and len(search_results) > 0:
+                    # scrape_url annotates the results in place, keep the cached ones untouched.
+                    # the pages making the quorum depend on timing: a replay uses the recorded ones.
+                    scraped_results = [dict(result) for result in search_results]
+                    search_results = await self._replayed_step(
+                        "scraped_search_results",
+                        {"urls": [result.get("url") for result in search_results]},
+                        lambda: self.scrape_urls(search_results=scraped_results),
+                    )
+
+            if isinstance(search_results, list) and len(search_results) > 0:
+                metadata = [x["metadata"] for x in search_results if x.get("metadata")]
+                browsed_answers = self.build_browsed_answers(
+                    task=task, search_results=search_results
+                )
+                search_answer = await self.formulate_search_answer(
+                    task=task, browsed_answers=browsed_answers
+                )
+                response = {"search_answer": search_answer, "metadata": metadata}
+            else:
+                response = "No response from Internet Search Tool !!"
 
-        return ToolResponse(tool=tool, response=response)
+            return ToolResponse(tool=tool, response=response)
 
     async def forward(self, task: str, context: Optional[str] = ""):
-        context = (
-            self.pre_processesed_fields.background_story + context
-            if context
-            else self.pre_processesed_fields.background_story
-        )
+        with get_tracer().span(
+            f"agent.{type(self).__name__}", "agent", agent=self.name
+        ):
+            context = (
+                self.pre_processesed_fields.background_story + context
+                if context
+                else self.pre_processesed_fields.background_story
+            )
 
-        selected_tools_and_agents_response = await self.select_tools_and_agents(
-            task=GivenTaskAndContext(task=task, context=context)
-        )
+            selected_tools_and_agents_response = await self.select_tools_and_agents(
+                task=GivenTaskAndContext(task=task, context=context)
+            )
 
-        tools_to_run, agents_to_execute = (
-            selected_tools_and_agents_response.tools_to_run,
-            selected_tools_and_agents_response.agents_to_execute,
-        )
+            tools_to_run, agents_to_execute = (
+                selected_tools_and_agents_response.tools_to_run,
+                selected_tools_and_agents_response.agents_to_execute,
+            )
 
-        tools_operation_response = await asyncio.gather(
-            *[
-                self.run_internet_search(
-                    tool=tool, task=GivenTaskAndContext(task=task, context=context)
+            with url_registry_scope():
+                tools_operation_response = await asyncio.gather(
+                    *[
+                        self.run_internet_search(
+                            tool=tool,
+                            task=GivenTaskAndContext(task=task, context=context),
+                        )
+                        if tool.tool_name == "internet_search"
+                        else self._action.run_tool(tool)
+                        for tool in tools_to_run
+                    ],
+                    return_exceptions=True,
                 )
-                if tool.tool_name == "internet_search"
-                else self._action.run_tool(tool)
-                for tool in tools_to_run
+            # a failed tool keeps its error, the other tools their results.
+            tools_operation_response = [
+                (
+                    ToolResponse(tool=tool, error=describe_error(response))
+                    if isinstance(response, BaseException)
+                    else response
+                )
+                for tool, response in zip(tools_to_run, tools_operation_response)
             ]
-        )
-        agents_execution_response = await self._action.execute_agents(
-            agents_to_execute=agents_to_execute
-        )
+            agents_execution_response = await self._action.execute_agents(
+                agents_to_execute=agents_to_execute
+            )
 
-        task_response = await self._action.generate_task_response(
-            task=GivenTaskAndContext(task=task, context=context),
-            tools_operation_response=tools_operation_response,
-            agents_execution_response=agents_execution_response,
-        )
+            task_response = await self._action.generate_task_response(
+                task=GivenTaskAndContext(task=task, context=context),
+                tools_operation_response=tools_operation_response,
+                agents_execution_response=agents_execution_response,
+            )
 
-        return task_response
+            return task_response
 
 
 if __name__ == "__main__":
     # from dspy.primitives.assertions import assert_transform_module, backtrack_handler
     # from functools import partial
+    configure_runtime()
     agent = SearchAgent()
     task = """
 
     Who won the t20 world cup 2024?
     """
-    response = asyncio.run(agent(task=task))
+
+    async def main():
+        try:
+            return await agent(task=task)
+        finally:
+            await close_session()
+
+    response = asyncio.run(main())
     print(response)
@@ -0,0 +1,44 @@
+import os
+import sys
+import pytest
+
+# the modules live at the root of the repository.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("TAVILY_API_KEY", "offline")
+os.environ.setdefault("OPENAI_API_KEY", "offline")
+
+
+@pytest.fixture
+def offline_runtime(monkeypatch):
+    """Runtime of a test: no LLM cache, no document store, an empty tool cache and agent pool.
+
+    The process globals (caches, stores, agent pool, Tavily URL, configured LM) are restored after
+    the test, whatever it changed.
+    """
+    import dspy
+    import agent_pool
+    import document_store
+    import llm
+    import tool
+    import tool_cache
+    import trajectory_store
+
+    for module, names in (
+        (llm, ("_llm_cache", "_llm_cache_enabled")),
+        (document_store, ("_document_store", "_document_store_enabled")),
+        (tool_cache, ("_tool_cache",)),
+        (trajectory_store, ("_storage",)),
+        (tool, ("TAVILY_API_URL",)),
+    ):
+        for name in names:
+            # set to itself: monkeypatch puts the current value back after the test.
+            monkeypatch.setattr(module, name, getattr(module, name))
+    monkeypatch.setattr(agent_pool, "_agent_pool", agent_pool.AgentPool())
+    lm = dspy.settings.lm
+
+    llm.configure_llm_cache(enabled=False)
+    document_store.configure_document_store(enabled=False)
+    tool_cache.configure_tool_cache()
+    yield
+    dspy.configure(lm=lm)
@@ -0,0 +1,53 @@
+import json
+import asyncio
+from batch import BatchRunner, completed_task_ids, load_tasks
+
+
+class EchoAgent:
+    async def forward(self, task: str, context=None) -> str:
+        await asyncio.sleep(0)
+        return task.upper()
+
+
+def test_bad_inputs_fail_alone_and_a_cut_line_is_ended(offline_runtime, tmp_path):
+    tasks_path = tmp_path / "tasks.jsonl"
+    tasks_path.write_text(
+        '"first"\n'
+        '{"task": "second", "agent": "nope"}\n'
+        '{"context": "no task"}\n'
+        '{"task": "broken\n'
+        '{"id": "last", "task": "last"}\n',
+        encoding="utf-8",
+    )
+    results_path = tmp_path / "results.jsonl"
+    # a crash cut the last result of the previous run.
+    results_path.write_text('{"id": "cut", "agent": "pres', encoding="utf-8")
+    runner = BatchRunner(concurrency=2, agents={"presentation": EchoAgent})
+
+    stats = asyncio.run(
+        runner.arun_all(load_tasks(str(tasks_path)), output_path=str(results_path))
+    )
+
+    assert (stats.succeeded, stats.failed) == (2, 3)
+    lines = results_path.read_text(encoding="utf-8").splitlines()
+    assert lines[0] == '{"id": "cut", "agent": "pres'
+    results = [json.loads(line) for line in lines[1:]]
+    assert sorted(result["response"] for result in results if result["error"] is None) == [
+        "FIRST",
+        "LAST",
+    ]
+    assert {"line-4", "last"} <= {result["id"] for result in results}
+    assert "last" in completed_task_ids(str(results_path))
+
+
+def test_resume_does_not_report_the_invalid_inputs_again(offline_runtime, tmp_path):
+    tasks = ["first", {"task": "second", "agent": "nope"}, {"context": "no task"}]
+    results_path = tmp_path / "results.jsonl"
+    runner = BatchRunner(concurrency=2, agents={"presentation": EchoAgent})
+    asyncio.run(runner.arun_all(tasks, output_path=str(results_path)))
+    lines = results_path.read_text(encoding="utf-8")
+
+    stats = asyncio.run(runner.arun_all(tasks, output_path=str(results_path)))
+
+    assert (stats.succeeded, stats.failed, stats.skipped) == (0, 0, 3)
+    assert results_path.read_text(encoding="utf-8") == lines
@@ -0,0 +1,14 @@
+import asyncio
+from cache import LRUCache, SQLiteCache, TieredCache
+
+
+def test_async_access_reads_and_writes_the_disk_tier(tmp_path):
+    path = str(tmp_path / "llm.sqlite")
+    writer = TieredCache(memory=LRUCache(), disk=SQLiteCache(path=path))
+    asyncio.run(writer.aset("key", "value"))
+
+    reader = TieredCache(memory=LRUCache(), disk=SQLiteCache(path=path))
+    assert asyncio.run(reader.aget("key")) == "value"
+    assert asyncio.run(reader.aget("key")) == "value"
+    assert asyncio.run(reader.aget("other", "default")) == "default"
+    assert (reader.stats.disk_hits, reader.stats.memory_hits, reader.stats.misses) == (1, 1, 1)
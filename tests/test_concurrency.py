@@ -0,0 +1,109 @@
+"""The slides are researched and the search results scraped concurrently, against a local aiohttp
+stub of Tavily and the websites answering every request after a fixed latency.
+"""
+
+import time
+import asyncio
+import dspy
+from aiohttp import web
+import tool
+from benchmarks.fakes import Distribution, ScriptedLM, agent_responders
+from http_client import close_session
+from presentation_agent import PresentationAIAgent
+from search_agent import SearchAgent
+
+LATENCY = 0.2
+RESULTS_PER_QUERY = 3
+PAGE = "<html><head><title>Page {n}</title></head><body><p>Agentic workflows page {n}.</p></body></html>"
+
+
+class StubServer:
+    """GET /pages/<n> serves a small page, POST /search a Tavily response with RESULTS_PER_QUERY of
+    those pages. Every request sleeps LATENCY without blocking the others.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.url = None
+        self._queries = 0
+        self._runner = None
+
+    async def page(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        await asyncio.sleep(LATENCY)
+        return web.Response(
+            text=PAGE.format(n=request.match_info["n"]), content_type="text/html"
+        )
+
+    async def search(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        payload = await request.json()
+        await asyncio.sleep(LATENCY)
+        first = self._queries * RESULTS_PER_QUERY
+        self._queries += 1
+        results = [
+            {
+                "url": f"{self.url}/pages/{first + index}",
+                "title": f"Result {index + 1} for {payload['query']}",
+                "content": "agentic workflows",
+                "score": 1.0 / (index + 1),
+            }
+            for index in range(RESULTS_PER_QUERY)
+        ]
+        return web.json_response(
+            {"query": payload["query"], "answer": "agentic workflows", "results": results}
+        )
+
+    async def __aenter__(self) -> "StubServer":
+        app = web.Application()
+        app.add_routes(
+            [web.get("/pages/{n}", self.page), web.post("/search", self.search)]
+        )
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}"
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await close_session()
+        await self._runner.cleanup()
+
+
+def test_search_results_are_scraped_concurrently(offline_runtime):
+    urls = 6
+
+    async def main():
+        async with StubServer() as server:
+            agent = SearchAgent(scrape_quorum=None, scrape_quorum_chars=None)
+            search_results = [{"url": f"{server.url}/pages/{n}"} for n in range(urls)]
+            start = time.perf_counter()
+            scraped = await agent.scrape_urls(search_results=search_results)
+            return time.perf_counter() - start, scraped, server.requests
+
+    elapsed, scraped, requests = asyncio.run(main())
+
+    assert requests == urls
+    assert all(result.get("scraped_content") for result in scraped)
+    assert elapsed < urls * LATENCY / 2
+
+
+def test_slides_are_researched_concurrently(offline_runtime, monkeypatch):
+    slides = 4
+    dspy.configure(lm=ScriptedLM(agent_responders(slides, Distribution(20))))
+
+    async def main():
+        async with StubServer() as server:
+            monkeypatch.setattr(tool, "TAVILY_API_URL", server.url)
+            start = time.perf_counter()
+            presentation = await PresentationAIAgent().forward(task="Agentic workflows")
+            return time.perf_counter() - start, presentation, server.requests
+
+    elapsed, presentation, requests = asyncio.run(main())
+
+    # every slide searches once and scrapes the pages of its results.
+    assert requests == slides * (1 + RESULTS_PER_QUERY)
+    assert len(presentation) == slides
+    assert elapsed < requests * LATENCY / 2
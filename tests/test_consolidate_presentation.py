@@ -0,0 +1,31 @@
+from presentation_agent import SlideContent, consolidate_presentation
+
+
+def test_content_titles_mentioning_sources_keep_their_content():
+    deck = [
+        SlideContent(title="Data Sources for Clinical AI", content="- EHR records\n- Imaging"),
+        SlideContent(title="Links between agents", content="- Agents share a message bus"),
+    ]
+
+    assert consolidate_presentation(deck) == deck
+
+
+def test_reference_slides_are_merged_keeping_their_other_lines():
+    deck = [
+        SlideContent(
+            title="References",
+            content="- https://a.example/page\nGathered from vendor reports",
+        ),
+        SlideContent(title="Overview", content="- Agents plan and act"),
+        SlideContent(
+            title="Sources",
+            content="- https://b.example/page\n- https://a.example/page.",
+        ),
+    ]
+
+    slides = consolidate_presentation(deck)
+
+    assert [slide.title for slide in slides] == ["Overview", "References"]
+    assert slides[-1].content == (
+        "Gathered from vendor reports\n- https://a.example/page\n- https://b.example/page"
+    )
@@ -0,0 +1,38 @@
+"""The deadline and trajectory of a presentation run do not outlive it in the caller's context."""
+
+import json
+import asyncio
+from contextlib import aclosing
+import dspy
+from benchmarks.fakes import Distribution, ScriptedLM, agent_responders
+from deadline import remaining
+from presentation_agent import PresentationAIAgent
+from trajectory import current_trajectory
+
+
+def no_tools(prompt: str) -> str:
+    return json.dumps(
+        {"tools_to_run": [], "agents_to_execute": [], "reasoning": "scripted"}
+    )
+
+
+def test_run_leaves_the_caller_context_untouched(offline_runtime):
+    responders = agent_responders(2, Distribution(20))
+    responders["Selected Tools And Agents"] = no_tools
+    dspy.configure(lm=ScriptedLM(responders))
+    agent = PresentationAIAgent()
+
+    async def main():
+        seen = []
+        async with aclosing(agent.astream(task="Agentic workflows", timeout=60)) as events:
+            async for event in events:
+                # the consumer keeps its own deadline and trajectory between the events.
+                seen.append((event.event, remaining(), current_trajectory.get()))
+        return seen, remaining(), current_trajectory.get()
+
+    seen, time_left, trajectory = asyncio.run(main())
+
+    assert [event for event, _, _ in seen][-1] == "presentation"
+    assert all(left is None and current is None for _, left, current in seen)
+    assert time_left is None
+    assert trajectory is None
@@ -0,0 +1,24 @@
+import time
+import pytest
+from document_store import DocumentStore
+
+
+def test_max_age_search_scores_against_the_recent_documents_only(tmp_path):
+    fresh_only = DocumentStore(path=str(tmp_path / "fresh.sqlite"))
+    fresh_only.put("https://a.example/agents", "agentic workflows with tools")
+
+    mixed = DocumentStore(path=str(tmp_path / "mixed.sqlite"))
+    mixed.put("https://a.example/agents", "agentic workflows with tools")
+    for index in range(3):
+        mixed.put(f"https://old.example/{index}", f"stale page number {index} about cooking")
+    with mixed._connection:
+        mixed._connection.execute(
+            "UPDATE documents SET fetched_at = ? WHERE url LIKE 'https://old.example/%'",
+            (time.time() - 3600,),
+        )
+
+    [expected] = fresh_only.search("agentic workflows")
+    [found] = mixed.search("agentic workflows", max_age=60)
+
+    assert found.url == expected.url
+    assert found.score == pytest.approx(expected.score)
@@ -0,0 +1,69 @@
+"""A presentation run recorded with record_scope replays without calling the LM or the websites."""
+
+import asyncio
+import dspy
+import tool
+import tool_cache
+from benchmarks.fakes import Distribution, FixtureServer, ScriptedLM, agent_responders
+from http_client import close_session
+from presentation_agent import PresentationAIAgent, ReviewPresentationSignature
+from replay import Replay, record_scope, replay_scope
+from trajectory import Trajectory
+
+
+class TerseReviewSignature(ReviewPresentationSignature):
+    """Keep the slides as they are, only fix their typos."""
+
+
+def run(agent: PresentationAIAgent) -> list:
+    async def main():
+        try:
+            return await agent.forward(task="Agentic workflows")
+        finally:
+            await close_session()
+
+    return asyncio.run(main())
+
+
+def record(monkeypatch, server: FixtureServer):
+    monkeypatch.setattr(tool, "TAVILY_API_URL", server.url)
+    dspy.configure(lm=ScriptedLM(agent_responders(2, Distribution(20))))
+    with record_scope(Trajectory()) as recording:
+        presentation = run(PresentationAIAgent())
+    # the replay must not be served by the tool cache of the recorded run.
+    tool_cache.configure_tool_cache()
+    return presentation, Replay.from_trajectory(recording)
+
+
+def test_full_replay_calls_neither_the_lm_nor_the_websites(
+    offline_runtime, monkeypatch
+):
+    with FixtureServer(results_per_query=2) as server:
+        presentation, replay = record(monkeypatch, server)
+        requests = server.requests
+        lm = ScriptedLM(agent_responders(2, Distribution(20)))
+        dspy.configure(lm=lm)
+        with replay_scope(replay):
+            replayed = run(PresentationAIAgent())
+
+    assert replayed == presentation
+    assert lm.calls == 0
+    assert server.requests == requests
+    assert replay.misses == 0
+
+
+def test_changed_prompt_only_misses_its_node(offline_runtime, monkeypatch):
+    with FixtureServer(results_per_query=2) as server:
+        _, replay = record(monkeypatch, server)
+        requests = server.requests
+        lm = ScriptedLM(agent_responders(2, Distribution(20)))
+        dspy.configure(lm=lm)
+        agent = PresentationAIAgent()
+        agent._review_presentation = dspy.TypedChainOfThought(TerseReviewSignature)
+        with replay_scope(replay):
+            run(agent)
+
+    # the review is the last node, nothing downstream of it.
+    assert replay.misses == 1
+    assert lm.calls >= 1
+    assert server.requests == requests
@@ -0,0 +1,23 @@
+import asyncio
+import pytest
+from tool_cache import ToolCache
+
+
+def test_failed_call_is_not_cached():
+    cache = ToolCache()
+    calls = []
+
+    async def flaky():
+        calls.append(None)
+        if len(calls) == 1:
+            raise ConnectionError("transient")
+        return ["result"]
+
+    async def main():
+        with pytest.raises(ConnectionError):
+            await cache.run("internet_search", {"query": "q"}, flaky)
+        return await cache.run("internet_search", {"query": "q"}, flaky)
+
+    assert asyncio.run(main()) == ["result"]
+    assert len(calls) == 2
+    assert cache.stats.hits == 0
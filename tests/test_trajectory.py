@@ -0,0 +1,22 @@
+from tools_agents_selection import GivenTaskAndContext
+from trajectory import State, Trajectory
+from trajectory_store import TrajectoryStorage
+
+
+def test_loaded_trajectory_reads_its_states_from_the_log(tmp_path):
+    storage = TrajectoryStorage(
+        blob_dir=str(tmp_path / "blobs"), log_dir=str(tmp_path / "logs"), inline_limit=16
+    )
+    trajectory = Trajectory(task=GivenTaskAndContext(task="deck"))
+    trajectory._storage = storage
+    for index in range(5):
+        trajectory.add_state(
+            State(task=GivenTaskAndContext(task=f"slide {index}"), response="x" * 100 * index)
+        )
+
+    loaded = Trajectory.load(storage.log_path(trajectory.id), storage=storage)
+
+    assert len(loaded.states) == 5
+    last = loaded.get_last_state()
+    assert last.task.task == "slide 4"
+    assert last.response == "x" * 400
@@ -0,0 +1,12 @@
+from url_registry import canonicalize_url
+
+
+def test_tracking_params_are_dropped_and_ref_kept():
+    assert (
+        canonicalize_url("HTTPS://GitHub.com:443/a/b?utm_source=x&ref=main&fbclid=1#top")
+        == "https://github.com/a/b?ref=main"
+    )
+
+
+def test_malformed_port_keeps_the_netloc():
+    assert canonicalize_url("http://A.com:abc/page?b=2&a=1") == "http://a.com:abc/page?a=1&b=2"
@@ -1,23 +1,63 @@
+import os
 import asyncio
-from langchain_community.tools import tavily_search
+import logging
 from pydantic import BaseModel
-from typing import Any, Dict
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Optional, Tuple
 from pydantic.fields import Field
-from utils import (
-    custom_extractor,
-    transform_schema_args_type,
+from utils import schema_args_type
+from http_client import close_session, fetch_text, post_json
+from extractor import aextract_page, get_extractor
+from scheduler import get_scheduler
+from document_store import StoredDocument, get_document_store
+from runtime_config import LazyClient
+from deadline import describe_error
+from tracing import annotate, get_tracer
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+# overridable to point the tools at a stub backend (see benchmarks/fakes.py).
+TAVILY_API_URL = os.getenv("TAVILY_API_URL", "https://api.tavily.com")
+
+# descriptions of the langchain tavily tools, kept here so that importing the tools stays cheap.
+TAVILY_SEARCH_DESCRIPTION = "A search engine optimized for comprehensive, accurate, and trusted results. Useful for when you need to answer questions about current events. Input should be a search query."
+TAVILY_ANSWER_DESCRIPTION = (
+    TAVILY_SEARCH_DESCRIPTION
+    + " This returns only the answer - not the original source data."
 )
-from langchain_community.tools.tavily_search import TavilySearchResults, TavilyAnswer
-from langchain_community.document_loaders.recursive_url_loader import RecursiveUrlLoader
-from dotenv import load_dotenv
 
 
-load_dotenv()
+def _tavily_search():
+    from langchain_community.tools.tavily_search import TavilySearchResults
+
+    return TavilySearchResults()
+
+
+def _tavily_answer():
+    from langchain_community.tools.tavily_search import TavilyAnswer
+
+    return TavilyAnswer()
 
 
 class LangChainCommunityTools:
-    tavily_search = TavilySearchResults()
-    tavily_answer = TavilyAnswer()
+    # langchain_community is slow to import, the tools are built on first use.
+    tavily_search = LazyClient(_tavily_search)
+    tavily_answer = LazyClient(_tavily_answer)
+
+
+async def tavily_raw_results(query: str, **params) -> dict:
+    """Same request as TavilySearchAPIWrapper.raw_results_async, but over the shared connection pool."""
+    api_wrapper = LangChainCommunityTools.tavily_search.api_wrapper
+    payload = {
+        "api_key": api_wrapper.tavily_api_key.get_secret_value(),
+        "query": query,
+        **params,
+    }
+    return await get_scheduler().run(
+        "tavily", lambda: post_json(f"{TAVILY_API_URL}/search", payload)
+    )
 
 
 class WebsiteScrapper(BaseModel):
@@ -30,60 +70,231 @@ class WebsiteScrapper(BaseModel):
 
     def __init__(self, /, **data: Any) -> None:
         super().__init__(**data)
-        self.args = transform_schema_args_type(self._run.__annotations__.copy())
+        self.args = schema_args_type(type(self)._run)
 
     def _run(self, url: str, max_depth: int = 2):
-        loader = RecursiveUrlLoader(url=url, extractor=custom_extractor)
+        from langchain_community.document_loaders.recursive_url_loader import (
+            RecursiveUrlLoader,
+        )
+
+        loader = RecursiveUrlLoader(
+            url=url, max_depth=max_depth, extractor=get_extractor()
+        )
         result = loader.load()
         return result
 
     async def _arun(self, url: str, max_depth: int = 2):
-        return self._run(url=url, max_depth=max_depth)
+        return [
+            document async for document in self._astream(url=url, max_depth=max_depth)
+        ]
+
+    async def _astream(
+        self,
+        url: str,
+        max_depth: int = 2,
+        max_pages: Optional[int] = None,
+        max_chars: Optional[int] = None,
+    ) -> AsyncIterator["Document"]:
+        """Crawl breadth first and yield every page as soon as it is parsed.
+
+        Fetching stops once 'max_pages' pages were requested or 'max_chars' characters were yielded,
+        the last document being truncated to the remaining character budget. Pending fetches are cancelled.
+        """
+        visited = {url}
+        frontier = [url]
+        n_pages, n_chars = 0, 0
+        for depth in range(max_depth):
+            if max_pages is not None:
+                frontier = frontier[: max_pages - n_pages]
+            if not frontier:
+                break
+            n_pages += len(frontier)
+            # links are only extracted when the next level can still fetch pages.
+            follow_links = depth < max_depth - 1 and (
+                max_pages is None or n_pages < max_pages
+            )
+            next_frontier = []
+            page_max_chars = max_chars - n_chars if max_chars is not None else None
+            tasks = [
+                asyncio.create_task(
+                    self._afetch_page(link, follow_links, max_chars=page_max_chars)
+                )
+                for link in frontier
+            ]
+            try:
+                for next_page in asyncio.as_completed(tasks):
+                    document, sub_links = await next_page
+                    for link in sub_links:
+                        if link not in visited:
+                            visited.add(link)
+                            next_frontier.append(link)
+                    if document is None:
+                        continue
+                    if max_chars is not None:
+                        document.page_content = document.page_content[
+                            : max_chars - n_chars
+                        ]
+                    n_chars += len(document.page_content)
+                    yield document
+                    if max_chars is not None and n_chars >= max_chars:
+                        return
+            finally:
+                for task in tasks:
+                    task.cancel()
+            frontier = next_frontier
+
+    async def _afetch_page(
+        self, url: str, follow_links: bool, max_chars: Optional[int] = None
+    ) -> Tuple[Optional["Document"], List[str]]:
+        from langchain_core.documents import Document
+        from langchain_core.utils.html import extract_sub_links
+
+        # pages already in the local document store are served from it, or revalidated with a
+        # conditional GET once they are older than the store's 'revalidate_after'.
+        # the store is SQLite (and put compresses and indexes the page): kept off the event loop.
+        document_store = get_document_store()
+        stored = (
+            await asyncio.to_thread(document_store.get, url)
+            if document_store is not None
+            else None
+        )
+        if stored is not None and (
+            (
+                not stored.complete
+                and (max_chars is None or len(stored.text) < max_chars)
+            )
+            or (follow_links and stored.links is None)
+        ):
+            # the stored copy does not hold what this call needs. Its links are only missing for a
+            # crawl going deeper, never for a single page scrape.
+            stored = None
+        if stored is not None and document_store.is_fresh(stored):
+            annotate(document_store="fresh")
+            return self._stored_document(stored, max_chars), stored.links or []
+
+        request_headers = stored.conditional_headers() if stored is not None else {}
+        with get_tracer().span("http.fetch", "http", url=url) as span:
+            try:
+                status, headers, text = await get_scheduler().run(
+                    "http", lambda: fetch_text(url, headers=request_headers)
+                )
+            except Exception as e:
+                logger.warning(
+                    f"Unable to load {url}. Received error {e} of type {e.__class__.__name__}"
+                )
+                span.error = describe_error(e)
+                return None, []
+            span.set(status=status, output_bytes=len(text or ""))
+        if status == 304 and stored is not None:
+            annotate(document_store="revalidated")
+            await asyncio.to_thread(document_store.touch, url)
+            return self._stored_document(stored, max_chars), stored.links or []
+        annotate(document_store="miss")
+
+        content, page_metadata = await aextract_page(text, max_chars=max_chars)
+        metadata = {
+            "source": url,
+            "content_type": _header(headers, "Content-Type") or "",
+            **page_metadata,
+        }
+        document = (
+            Document(page_content=content, metadata=metadata) if content else None
+        )
+        sub_links = (
+            extract_sub_links(text, url, continue_on_failure=True)
+            if follow_links
+            else []
+        )
+        if document_store is not None and status == 200 and content:
+            await asyncio.to_thread(
+                document_store.put,
+                url,
+                text=content,
+                metadata=metadata,
+                etag=_header(headers, "ETag"),
+                last_modified=_header(headers, "Last-Modified"),
+                complete=max_chars is None or len(content) < max_chars,
+                links=sub_links if follow_links else None,
+            )
+        return document, sub_links
+
+    @staticmethod
+    def _stored_document(
+        stored: StoredDocument, max_chars: Optional[int] = None
+    ) -> Optional["Document"]:
+        from langchain_core.documents import Document
+
+        content = stored.text[:max_chars] if max_chars is not None else stored.text
+        return (
+            Document(page_content=content, metadata=dict(stored.metadata))
+            if content
+            else None
+        )
+
+
+def _header(headers: Dict[str, str], name: str) -> Optional[str]:
+    # the response headers are a plain dict, lookup case insensitively.
+    name = name.lower()
+    return next((value for key, value in headers.items() if key.lower() == name), None)
 
 
 class InternetSearch(BaseModel):
     name: str = Field("internet_search")
-    description: str = Field(LangChainCommunityTools.tavily_search.description)
+    description: str = Field(
+        TAVILY_SEARCH_DESCRIPTION
+        + """The tool will search and browse internet.Use this tool only when the query requires analysis in depth and understanding else use internet_answer for direct answer.
+                To run this tool, generate the right query with less than 100 characters.
+            """
+    )
 
     args: Dict[str, Any] = Field(default_factory=dict)
 
     def __init__(self, /, **data: Any) -> None:
         super().__init__(**data)
-        self.args = transform_schema_args_type(self._run.__annotations__.copy())
-        self.description = (
-            self.description
-            + """The tool will search and browse internet.Use this tool only when the query requires analysis in depth and understanding else use internet_answer for direct answer.
-                To run this tool, generate the right query with less than 100 characters.
-            """
-        )
+        self.args = schema_args_type(type(self)._run)
 
     def _run(self, query: str):
         return LangChainCommunityTools.tavily_search._run(query=query)
 
     async def _arun(self, query: str):
-        return self._run(query=query)
+        # errors are raised, not returned: the tool cache must not keep them as results.
+        # Action.run_tool reports them as the error of the ToolResponse.
+        tool = LangChainCommunityTools.tavily_search
+        raw_results = await tavily_raw_results(
+            query,
+            max_results=tool.max_results,
+            search_depth=tool.search_depth,
+            include_domains=tool.include_domains,
+            exclude_domains=tool.exclude_domains,
+            include_answer=tool.include_answer,
+            include_raw_content=tool.include_raw_content,
+            include_images=tool.include_images,
+        )
+        return tool.api_wrapper.clean_results(raw_results["results"])
 
 
 class InternetAnswer(BaseModel):
     name: str = Field("internet_answer")
-    description: str = Field(LangChainCommunityTools.tavily_answer.description)
+    description: str = Field(
+        TAVILY_ANSWER_DESCRIPTION
+        + """"It won't browse the web. Use this tool only when the query requires straightforward answer without any analysis else use internet_search for depth and understanding."
+            """
+    )
 
     args: Dict[str, Any] = Field(default_factory=dict)
 
     def __init__(self, /, **data: Any) -> None:
         super().__init__(**data)
-        self.args = transform_schema_args_type(self._run.__annotations__.copy())
-        self.description = (
-            self.description
-            + """"It won't browse the web. Use this tool only when the query requires straightforward answer without any analysis else use internet_search for depth and understanding."
-            """
-        )
+        self.args = schema_args_type(type(self)._run)
 
     def _run(self, query: str):
         return LangChainCommunityTools.tavily_answer._run(query=query)
 
     async def _arun(self, query: str):
-        return self._run(query=query)
+        raw_results = await tavily_raw_results(
+            query, max_results=5, include_answer=True, search_depth="basic"
+        )
+        return raw_results["answer"]
 
 
 if __name__ == "__main__":
@@ -94,4 +305,11 @@ if __name__ == "__main__":
     #         **{"url": "https://dspy-docs.vercel.app/docs/quick-start/installation"}
     #     )
     # )
-    print(asyncio.run(tool._arun(**{"query": "Where is Taj Mahal?"})))
+
+    async def main():
+        try:
+            return await tool._arun(**{"query": "Where is Taj Mahal?"})
+        finally:
+            await close_session()
+
+    print(asyncio.run(main()))
@@ -0,0 +1,109 @@
+import json
+import asyncio
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, Optional
+from cache import LRUCache
+from replay import replayed_or_run
+from tracing import annotate
+
+# seconds a tool result stays fresh, 0 disables caching for the tool.
+DEFAULT_TOOL_TTLS = {
+    "internet_search": 3600.0,
+    "internet_answer": 3600.0,
+    "website_scrapper": 6 * 3600.0,
+}
+
+_MISSING = object()
+
+
+class ToolCache:
+    """TTL cache in front of the tools. Concurrent identical calls share one in-flight call (single-flight).
+
+    A call raising is never cached: the tools raise their errors instead of returning them.
+    """
+
+    def __init__(
+        self,
+        ttls: Optional[Dict[str, float]] = None,
+        default_ttl: float = 600.0,
+        max_entries: int = 2048,
+    ):
+        self.ttls = {**DEFAULT_TOOL_TTLS, **(ttls or {})}
+        self.default_ttl = default_ttl
+        self.coalesced = 0
+        self._cache = LRUCache(max_entries=max_entries)
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    @property
+    def stats(self):
+        return self._cache.stats
+
+    @staticmethod
+    def key(tool_name: str, args: dict) -> str:
+        # canonical form: argument order and whitespace never change the key.
+        payload = json.dumps([tool_name, args], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def run(
+        self, tool_name: str, args: dict, call: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        key = self.key(tool_name, args)
+        return await replayed_or_run(
+            "tool", key, lambda: self._run(tool_name, key, call)
+        )
+
+    async def _run(
+        self, tool_name: str, key: str, call: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        ttl = self.ttls.get(tool_name, self.default_ttl)
+        if ttl <= 0:
+            return await call()
+
+        cached = self._cache.get(key, _MISSING)
+        annotate(cache_hit=cached is not _MISSING)
+        if cached is not _MISSING:
+            return cached
+
+        task = self._inflight.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(self._run_and_store(key, ttl, call))
+            self._inflight[key] = task
+        else:
+            self.coalesced += 1
+            annotate(coalesced=True)
+        # a cancelled caller must not cancel the call shared with the other callers.
+        return await asyncio.shield(task)
+
+    async def _run_and_store(
+        self, key: str, ttl: float, call: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        try:
+            result = await call()
+            self._cache.set(key, result, ttl=ttl)
+            return result
+        finally:
+            if self._inflight.get(key) is asyncio.current_task():
+                del self._inflight[key]
+
+    async def arun(self, tool, **kwargs) -> Any:
+        """Cached 'tool._arun(**kwargs)'."""
+        return await self.run(tool.name, kwargs, lambda: tool._arun(**kwargs))
+
+    def clear(self):
+        self._cache.clear()
+
+
+_tool_cache: Optional[ToolCache] = None
+
+
+def configure_tool_cache(**kwargs) -> ToolCache:
+    global _tool_cache
+    _tool_cache = ToolCache(**kwargs)
+    return _tool_cache
+
+
+def get_tool_cache() -> ToolCache:
+    global _tool_cache
+    if _tool_cache is None:
+        _tool_cache = ToolCache()
+    return _tool_cache
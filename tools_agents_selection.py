@@ -68,6 +68,9 @@ class ToolResponse(BaseModel):
         None, description="Tool ran using its argument values."
     )
     response: Any = Field(None, description="Response from the tool.")
+    error: Optional[str] = Field(
+        None, description="Error of the tool run (timeout, failure), None on success."
+    )
 
 
 class AgentWithArgsTypes(BaseModel):
@@ -116,6 +119,9 @@ class AgentResponse(BaseModel):
         None, description="Agent executed using its argument value."
     )
     response: Any = Field(None, description="Response from the agent.")
+    error: Optional[str] = Field(
+        None, description="Error of the agent execution (timeout, failure), None on success."
+    )
 
 
 class AvailableToolsAndAgents(BaseModel):
@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+from pydantic import BaseModel
+from pydantic.fields import Field
+from file_writer import FileWriter
+
+SERVICE_NAME = "agents_tutorial"
+# OTLP span kinds: internal for the agents, client for the calls leaving the process.
+_OTLP_SPAN_KINDS = {
+    "agent": 1,
+    "action": 1,
+    "llm": 3,
+    "tool": 3,
+    "scrape": 3,
+    "http": 3,
+}
+
+
+class Span(BaseModel):
+    """One timed node of a run: an agent, an action step, an LLM call, a tool call or a scrape."""
+
+    trace_id: str = Field(..., description="Id shared by all the spans of a run.")
+    span_id: str = Field(..., description="Id of the span.")
+    parent_id: Optional[str] = Field(None, description="Id of the enclosing span.")
+    name: str = Field(..., description="What ran, e.g. 'llm.GenerateTaskResponse'.")
+    kind: str = Field(
+        "internal", description="agent, action, llm, tool, scrape or http."
+    )
+    start_time: float = Field(default_factory=time.time, description="Epoch seconds.")
+    end_time: Optional[float] = Field(None, description="Epoch seconds.")
+    duration_seconds: Optional[float] = Field(None, description="Wall time.")
+    attributes: Dict[str, Any] = Field(
+        default_factory=dict,
+        description="queue_wait_seconds, prompt_tokens, completion_tokens, cache_hit, input_bytes, output_bytes, ...",
+    )
+    error: Optional[str] = Field(
+        None, description="Error of the node, None on success."
+    )
+
+    def set(self, **attributes: Any):
+        self.attributes.update(attributes)
+
+    def add(self, **counters: float):
+        for key, value in counters.items():
+            self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def to_otlp(self) -> dict:
+        """The span in the OTLP/JSON encoding."""
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": _OTLP_SPAN_KINDS.get(self.kind, 1),
+            "startTimeUnixNano": str(int(self.start_time * 1e9)),
+            "endTimeUnixNano": str(int((self.end_time or self.start_time) * 1e9)),
+            "attributes": [
+                _otlp_attribute(key, value)
+                for key, value in {"kind": self.kind, **self.attributes}.items()
+            ],
+            "status": (
+                {"code": 2, "message": self.error} if self.error else {"code": 1}
+            ),
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_attribute(key: str, value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class JSONLinesSpanExporter:
+    """Appends every finished span to a file, one OTLP/JSON 'ExportTraceServiceRequest' per line
+    (the format of the OpenTelemetry collector file exporter).
+
+    The spans are encoded and written by a background thread, 'flush' waits for them.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._writer = FileWriter("span-exporter")
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def export(self, span: Span):
+        self._writer.submit(self._write, span)
+
+    def _write(self, span: Span):
+        line = json.dumps(
+            {
+                "resourceSpans": [
+                    {
+                        "resource": {
+                            "attributes": [
+                                _otlp_attribute("service.name", SERVICE_NAME)
+                            ]
+                        },
+                        "scopeSpans": [
+                            {"scope": {"name": SERVICE_NAME}, "spans": [span.to_otlp()]}
+                        ],
+                    }
+                ]
+            },
+            default=str,
+        )
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(line + "\n")
+
+    def flush(self):
+        self._writer.flush()
+
+
+class Tracer:
+    """Creates the spans of the runs and hands the finished ones to the exporters.
+
+    Finished spans are also kept in memory (up to 'max_spans') for inspection.
+    """
+
+    def __init__(self, exporters: Optional[List[Any]] = None, max_spans: int = 10000):
+        self.exporters = exporters or []
+        self.max_spans = max_spans
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def start_span(self, name: str, kind: str = "internal", **attributes: Any) -> Span:
+        """Start a child of the current span (a new trace without one) and make it current.
+
+        The previous span is not restored: use 'span()' unless the span has to outlive the block,
+        e.g. across the yields of an async generator running in its own task.
+        """
+        parent = current_span.get()
+        span = Span(
+            trace_id=parent.trace_id if parent is not None else uuid.uuid4().hex,
+            span_id=uuid.uuid4().hex[:16],
+            parent_id=parent.span_id if parent is not None else None,
+            name=name,
+            kind=kind,
+            attributes=attributes,
+        )
+        current_span.set(span)
+        return span
+
+    def end_span(self, span: Span, error: Optional[BaseException] = None):
+        span.end_time = time.time()
+        span.duration_seconds = span.end_time - span.start_time
+        if error is not None and span.error is None:
+            span.error = f"{type(error).__name__}: {error}"
+        with self._lock:
+            self.spans.append(span)
+            del self.spans[: -self.max_spans]
+        for exporter in self.exporters:
+            exporter.export(span)
+
+    @contextmanager
+    def span(
+        self, name: str, kind: str = "internal", **attributes: Any
+    ) -> Iterator[Span]:
+        token = current_span.set(current_span.get())
+        span = self.start_span(name, kind, **attributes)
+        try:
+            yield span
+        except BaseException as e:
+            self.end_span(span, error=e)
+            raise
+        else:
+            self.end_span(span)
+        finally:
+            current_span.reset(token)
+
+
+def annotate(**attributes: Any):
+    """Set attributes on the current span, if any (e.g. the cache hit flag from inside the cache)."""
+    span = current_span.get()
+    if span is not None:
+        span.set(**attributes)
+
+
+def accumulate(**counters: float):
+    """Add to counters of the current span, if any (e.g. queue wait of a retried call)."""
+    span = current_span.get()
+    if span is not None:
+        span.add(**counters)
+
+
+_tracer: Optional[Tracer] = None
+
+
+def configure_tracing(path: Optional[str] = None, **kwargs) -> Tracer:
+    """(Re)build the tracer, exporting the spans to the JSON lines file 'path' if given."""
+    global _tracer
+    exporters = [JSONLinesSpanExporter(path)] if path else []
+    _tracer = Tracer(exporters=exporters, **kwargs)
+    return _tracer
+
+
+def get_tracer() -> Tracer:
+    if _tracer is None:
+        configure_tracing(path=os.getenv("TRACE_FILE"))
+    return _tracer
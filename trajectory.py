@@ -1,36 +1,270 @@
-from typing import List, Optional, Any
-from pydantic import BaseModel
+import uuid
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Set, Tuple, Any
+from pydantic import BaseModel, PrivateAttr
 from pydantic.fields import Field
 from tools_agents_selection import (
     GivenTaskAndContext,
     AgentResponse,
+    AgentWithArgsValues,
     ToolResponse,
+    ToolWithArgsValues,
     AvailableToolsAndAgents,
+    SelectedToolsAndAgents,
+)
+from trajectory_store import (
+    NodeRecord,
+    Payload,
+    StateRecord,
+    TrajectoryLog,
+    TrajectoryStorage,
+    decode_payload,
+    encode_payload,
+    get_trajectory_storage,
+    read_header,
+    read_log,
+    to_jsonable,
 )
 
 
 class State(BaseModel):
 
     task: GivenTaskAndContext = Field(None, description="Task of the state")
+    selected_tools_and_agents: Optional[SelectedToolsAndAgents] = Field(
+        None, description="Tools and team agents selected for the task."
+    )
     tools_used: List[ToolResponse] = Field([], description="Tools used")
     agents_interaction: List[AgentResponse] = Field(
         [], description="Team agents collaborated ."
     )
     response: Any = Field("", description="State response.")
     reward: int = Field(-1, description="Reward of the state for executing the task.")
+    error: Optional[str] = Field(
+        None, description="Error of the step (timeout, failure), None on success."
+    )
+    span_id: Optional[str] = Field(
+        None, description="Tracing span of the step, for its timings and token counts."
+    )
+
+
+def compact_state(state: State, storage: TrajectoryStorage) -> StateRecord:
+    task = state.task
+    return StateRecord(
+        task=storage.pack(task.task) if task is not None else None,
+        context=storage.pack(task.context) if task is not None else None,
+        selected=(
+            storage.pack(state.selected_tools_and_agents)
+            if state.selected_tools_and_agents is not None
+            else None
+        ),
+        tools=tuple(
+            NodeRecord(
+                name=storage.pack(tool_response.tool.tool_name),
+                arguments=storage.pack(tool_response.tool.argument_values),
+                response=storage.pack(tool_response.response),
+                error=tool_response.error,
+            )
+            for tool_response in state.tools_used
+        ),
+        agents=tuple(
+            NodeRecord(
+                name=storage.pack(agent_response.agent.agent_name),
+                arguments=storage.pack(agent_response.agent.argument_values),
+                response=storage.pack(agent_response.response),
+                error=agent_response.error,
+            )
+            for agent_response in state.agents_interaction
+        ),
+        response=storage.pack(state.response),
+        reward=state.reward,
+        error=state.error,
+        span_id=state.span_id,
+    )
+
+
+def expand_state(record: StateRecord, storage: TrajectoryStorage) -> State:
+    """The State of a record, its blobs read back. Models in the payloads come back as dicts."""
+    selected = storage.unpack(record.selected)
+    return State(
+        task=(
+            GivenTaskAndContext(
+                task=storage.unpack(record.task), context=storage.unpack(record.context)
+            )
+            if record.context is not None
+            else None
+        ),
+        selected_tools_and_agents=(
+            SelectedToolsAndAgents(**selected) if selected is not None else None
+        ),
+        tools_used=[
+            ToolResponse(
+                tool=ToolWithArgsValues(
+                    tool_name=node.name, argument_values=storage.unpack(node.arguments)
+                ),
+                response=storage.unpack(node.response),
+                error=node.error,
+            )
+            for node in record.tools
+        ],
+        agents_interaction=[
+            AgentResponse(
+                agent=AgentWithArgsValues(
+                    agent_name=node.name, argument_values=storage.unpack(node.arguments)
+                ),
+                response=storage.unpack(node.response),
+                error=node.error,
+            )
+            for node in record.agents
+        ],
+        response=storage.unpack(record.response),
+        reward=record.reward,
+        error=record.error,
+        span_id=record.span_id,
+    )
 
 
 class Trajectory(BaseModel):
+    """States of a run, kept as compact StateRecords whose large payloads are in the blob store
+    (when the trajectory storage has one).
+
+    Only the last 'max_records_in_memory' records stay in memory. With a log dir in the trajectory
+    storage every state is also appended to the log of the trajectory as it is added and the older
+    ones are read back from the log, without one they are dropped (see trajectory_store.py).
+    """
+
+    id: str = Field(
+        default_factory=lambda: uuid.uuid4().hex, description="Id of the trajectory."
+    )
     task: GivenTaskAndContext = Field(None, description="Original task given.")
     resources: AvailableToolsAndAgents = Field(
         None, description="Available resources.  "
     )
-    states: List[State] = Field([], description="List of states.")
     response: Any = Field(None, description="Final response")
     reward: int = Field(-1, description="Reward based on the final response. ")
 
+    _storage: TrajectoryStorage = PrivateAttr(default_factory=get_trajectory_storage)
+    _records: List[StateRecord] = PrivateAttr(default_factory=list)
+    # records dropped from memory that are in the log.
+    _spilled: int = PrivateAttr(0)
+    _log: Optional[TrajectoryLog] = PrivateAttr(None)
+    # LLM and tool results of the run, by cache key (see replay.py), in the log when there is one.
+    _calls: Dict[Tuple[str, str], Payload] = PrivateAttr(default_factory=dict)
+    _call_keys: Set[str] = PrivateAttr(default_factory=set)
+
+    @property
+    def storage(self) -> TrajectoryStorage:
+        return self._storage
+
+    @property
+    def logged(self) -> bool:
+        """Whether the states (and recorded calls) of the trajectory go to a log."""
+        return self._log is not None or self._storage.log_dir is not None
+
+    def _get_log(self) -> Optional[TrajectoryLog]:
+        if self._log is None:
+            path = self._storage.log_path(self.id)
+            if path is not None:
+                self._log = TrajectoryLog(path)
+                self._log.write(
+                    "trajectory",
+                    id=self.id,
+                    task=to_jsonable(self.task),
+                    resources=to_jsonable(self.resources),
+                )
+        return self._log
+
     def add_state(self, state: State):
-        self.states.append(state)
+        record = compact_state(state, self._storage)
+        self._records.append(record)
+        log = self._get_log()
+        if log is not None:
+            log.append(record)
+        max_records = self._storage.max_records_in_memory
+        if max_records is not None and len(self._records) > max_records:
+            del self._records[0]
+            if log is not None:
+                self._spilled += 1
+
+    def finish(self, response: Any, reward: int = -1):
+        """Set the final response (and log it)."""
+        self.response, self.reward = response, reward
+        log = self._get_log()
+        if log is not None:
+            log.write("response", response=to_jsonable(response), reward=reward)
+
+    def record_call(self, kind: str, key: str, value: Any):
+        """Keep the result of an LLM or tool call, once per key (see replay.record_call)."""
+        if key in self._call_keys:
+            return
+        self._call_keys.add(key)
+        payload = self._storage.pack(value)
+        log = self._get_log()
+        if log is not None:
+            log.write("call", kind=kind, key=key, value=encode_payload(payload))
+        else:
+            self._calls[(kind, key)] = payload
+
+    def iter_calls(self) -> Iterator[Tuple[str, str, Payload]]:
+        """(kind, key, payload) of the recorded calls."""
+        if self._log is not None:
+            for kind, entry in read_log(self._log.path):
+                if kind == "call":
+                    yield entry["kind"], entry["key"], decode_payload(entry["value"])
+        for (kind, key), payload in self._calls.items():
+            yield kind, key, payload
+
+    def iter_records(self) -> Iterator[StateRecord]:
+        if self._spilled:
+            spilled = (
+                record for kind, record in read_log(self._log.path) if kind == "state"
+            )
+            for _, record in zip(range(self._spilled), spilled):
+                yield record
+        yield from self._records
 
-    def get_last_state(self):
-        return self.states[-1] if self.states else None
+    def iter_states(self) -> Iterator[State]:
+        """The states one at a time, for long trajectories."""
+        for record in self.iter_records():
+            yield expand_state(record, self._storage)
+
+    @property
+    def states(self) -> List[State]:
+        return list(self.iter_states())
+
+    def get_last_state(self) -> Optional[State]:
+        if self._records:
+            return expand_state(self._records[-1], self._storage)
+        # a loaded trajectory: its states are only in the log.
+        record = None
+        for record in self.iter_records():
+            pass
+        return expand_state(record, self._storage) if record is not None else None
+
+    @classmethod
+    def load(
+        cls, path: str, storage: Optional[TrajectoryStorage] = None
+    ) -> "Trajectory":
+        """Trajectory of a log. Only the header is read here, the states are read from the log
+        (and their blobs from the blob store) when iterated. Added states go to the same log.
+        """
+        header, states = read_header(path)
+        trajectory = cls(
+            **{key: value for key, value in header.items() if value is not None}
+        )
+        if storage is not None:
+            trajectory._storage = storage
+        trajectory._log = TrajectoryLog(path)
+        trajectory._spilled = states
+        return trajectory
+
+
+# per invocation state, so one agent instance can serve concurrent tasks.
+current_state: ContextVar[Optional[State]] = ContextVar("current_state", default=None)
+current_trajectory: ContextVar[Optional[Trajectory]] = ContextVar(
+    "current_trajectory", default=None
+)
+# trajectories of the runs started in the context, for a caller wanting them once the runs are
+# over (see AgentHandle): the runs reset current_trajectory when they finish.
+collected_trajectories: ContextVar[Optional[List[Trajectory]]] = ContextVar(
+    "collected_trajectories", default=None
+)
@@ -0,0 +1,289 @@
+"""Compact records, blob store and JSON lines logs of the trajectories (see trajectory.py).
+
+Memory: without log dir a trajectory keeps its last 'max_records_in_memory' states only, the
+older ones are dropped (the final response and the states of a short run are all there). With a
+log dir the older states are read back from the log instead, and the recorded LLM and tool calls
+go to the log too. Set 'max_records_in_memory=None' to keep every state of an unlogged trajectory.
+
+The blob and log writes run on a background thread (file_writer.FileWriter): adding a state
+never waits on the disk, reading a log or a blob first waits for the pending writes.
+"""
+
+import os
+import sys
+import json
+import zlib
+import hashlib
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, Optional, Tuple, Union
+from pydantic import BaseModel
+from file_writer import FileWriter
+
+# content-addressed store of the large payloads, None keeps them inline (in memory). Opt-in like
+# the logs: nothing evicts the blobs, the directory grows with every run.
+DEFAULT_TRAJECTORY_BLOB_DIR = os.getenv("TRAJECTORY_BLOB_DIR")
+# JSON lines logs of the trajectories, one file per trajectory, None for no log.
+DEFAULT_TRAJECTORY_LOG_DIR = os.getenv("TRAJECTORY_LOG_DIR")
+# payloads serialized above this many characters are moved to the blob store.
+DEFAULT_INLINE_LIMIT = int(os.getenv("TRAJECTORY_INLINE_LIMIT", "2048"))
+# states of a trajectory kept in memory, the older ones are read back from its log (or dropped).
+DEFAULT_MAX_RECORDS_IN_MEMORY = 64
+
+_writer = FileWriter("trajectory-writer")
+
+
+@dataclass(frozen=True, slots=True)
+class BlobRef:
+    """A payload moved to the blob store, by the sha256 of its JSON text."""
+
+    digest: str
+    size: int
+
+
+Payload = Union[BlobRef, str, int, float, bool, None, list, dict]
+
+
+@dataclass(slots=True)
+class NodeRecord:
+    """A tool run or an agent execution of a state."""
+
+    name: str
+    arguments: Payload
+    response: Payload
+    error: Optional[str] = None
+
+
+@dataclass(slots=True)
+class StateRecord:
+    """Compact form of a trajectory State: interned strings, large payloads as BlobRefs."""
+
+    task: Payload
+    context: Optional[str]
+    selected: Payload
+    tools: Tuple[NodeRecord, ...]
+    agents: Tuple[NodeRecord, ...]
+    response: Payload
+    reward: int = -1
+    error: Optional[str] = None
+    span_id: Optional[str] = None
+
+
+class BlobStore:
+    """Content-addressed, zlib compressed blobs in a directory (two level fan-out by digest).
+
+    Identical payloads (the same page scraped by several slides) are stored once.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, digest: str) -> str:
+        return os.path.join(self.path, digest[:2], digest[2:])
+
+    def put(self, data: bytes) -> str:
+        """Digest of 'data', written in the background."""
+        digest = hashlib.sha256(data).hexdigest()
+        _writer.submit(self._write, digest, data)
+        return digest
+
+    def _write(self, digest: str, data: bytes):
+        file = self._file(digest)
+        if not os.path.exists(file):
+            os.makedirs(os.path.dirname(file), exist_ok=True)
+            # write then rename, so a concurrent reader never sees half a blob.
+            temporary = f"{file}.{os.getpid()}.{threading.get_ident()}"
+            with open(temporary, "wb") as blob:
+                blob.write(zlib.compress(data))
+            os.replace(temporary, file)
+
+    def get(self, digest: str) -> bytes:
+        _writer.flush()
+        with open(self._file(digest), "rb") as blob:
+            return zlib.decompress(blob.read())
+
+    def __contains__(self, digest: str) -> bool:
+        _writer.flush()
+        return os.path.exists(self._file(digest))
+
+
+def to_jsonable(value: Any) -> Any:
+    """JSON form of a value, models dumped and other objects as their str. Also the form of the
+    LLM cache keys and of the recorded predictions (llm.py).
+    """
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): to_jsonable(item) for key, item in value.items()}
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+class TrajectoryStorage:
+    """Where the trajectories put their large payloads (blob store) and their logs.
+
+    Without blob store the payloads stay inline, in memory.
+    """
+
+    def __init__(
+        self,
+        blob_dir: Optional[str] = DEFAULT_TRAJECTORY_BLOB_DIR,
+        log_dir: Optional[str] = DEFAULT_TRAJECTORY_LOG_DIR,
+        inline_limit: int = DEFAULT_INLINE_LIMIT,
+        max_records_in_memory: Optional[int] = DEFAULT_MAX_RECORDS_IN_MEMORY,
+    ):
+        self.blobs = BlobStore(blob_dir) if blob_dir else None
+        self.log_dir = log_dir
+        self.inline_limit = inline_limit
+        self.max_records_in_memory = max_records_in_memory
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+
+    def pack(self, value: Any) -> Payload:
+        """JSON form of 'value', or a BlobRef to it when it is larger than 'inline_limit'."""
+        value = to_jsonable(value)
+        if isinstance(value, str):
+            if len(value) <= self.inline_limit or self.blobs is None:
+                # short strings repeat a lot (tool names, instructions, background stories).
+                return sys.intern(value)
+        elif not isinstance(value, (list, dict)) or self.blobs is None:
+            return value
+        text = json.dumps(value, ensure_ascii=False)
+        if len(text) <= self.inline_limit:
+            return value
+        data = text.encode("utf-8")
+        return BlobRef(digest=self.blobs.put(data), size=len(data))
+
+    def unpack(self, value: Payload) -> Any:
+        if isinstance(value, BlobRef):
+            if self.blobs is None:
+                raise ValueError(f"blob {value.digest} without blob store")
+            return json.loads(self.blobs.get(value.digest))
+        return value
+
+    def log_path(self, trajectory_id: str) -> Optional[str]:
+        if not self.log_dir:
+            return None
+        return os.path.join(self.log_dir, f"{trajectory_id}.jsonl")
+
+
+def encode_payload(value: Any) -> Any:
+    """JSON form of a payload or a record, BlobRefs as {"$blob": digest, "size": size}."""
+    if isinstance(value, BlobRef):
+        return {"$blob": value.digest, "size": value.size}
+    if isinstance(value, (NodeRecord, StateRecord)):
+        return {
+            name: encode_payload(getattr(value, name)) for name in type(value).__slots__
+        }
+    if isinstance(value, (list, tuple)):
+        return [encode_payload(item) for item in value]
+    return value
+
+
+def decode_payload(value: Any) -> Payload:
+    # blob refs are only ever at the top of a payload.
+    if isinstance(value, dict) and "$blob" in value:
+        return BlobRef(digest=value["$blob"], size=value["size"])
+    if isinstance(value, str):
+        return sys.intern(value)
+    return value
+
+
+def _decode_node(value: Dict[str, Any]) -> NodeRecord:
+    return NodeRecord(
+        name=sys.intern(value["name"]),
+        arguments=decode_payload(value["arguments"]),
+        response=decode_payload(value["response"]),
+        error=value["error"],
+    )
+
+
+def decode_record(value: Dict[str, Any]) -> StateRecord:
+    return StateRecord(
+        task=decode_payload(value["task"]),
+        context=decode_payload(value["context"]),
+        selected=decode_payload(value["selected"]),
+        tools=tuple(_decode_node(node) for node in value["tools"]),
+        agents=tuple(_decode_node(node) for node in value["agents"]),
+        response=decode_payload(value["response"]),
+        reward=value["reward"],
+        error=value["error"],
+        span_id=value["span_id"],
+    )
+
+
+class TrajectoryLog:
+    """Append-only JSON lines file of a trajectory: a header line, then one line per state.
+
+    The lines are appended in the background. The file is opened per write, so a worker keeps no
+    descriptor per trajectory and the log can be read back while the trajectory is running.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def write(self, entry: str, **fields: Any):
+        line = json.dumps({"type": entry, **fields}, ensure_ascii=False)
+        _writer.submit(self._append, line)
+
+    def _append(self, line: str):
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(line + "\n")
+
+    def append(self, record: StateRecord):
+        self.write("state", **encode_payload(record))
+
+
+def read_log(path: str) -> Iterator[Tuple[str, Any]]:
+    """Lazily yield ('trajectory', header), ('state', StateRecord), ..., ('response', ...) from a
+    trajectory log.
+    """
+    _writer.flush()
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            kind = entry.pop("type")
+            yield kind, decode_record(entry) if kind == "state" else entry
+
+
+def read_header(path: str) -> Tuple[Dict[str, Any], int]:
+    """Header of a trajectory log (with the final response, if logged) and its number of states,
+    without decoding the states.
+    """
+    header, states = None, 0
+    _writer.flush()
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if line.startswith('{"type": "state"'):
+                states += 1
+            elif line.startswith(('{"type": "trajectory"', '{"type": "response"')):
+                entry = json.loads(line)
+                kind = entry.pop("type")
+                if kind == "trajectory":
+                    header = entry
+                elif kind == "response" and header is not None:
+                    header.update(entry)
+    if header is None:
+        raise ValueError(f"{path} is not a trajectory log")
+    return header, states
+
+
+_storage: Optional[TrajectoryStorage] = None
+
+
+def configure_trajectory_storage(**kwargs) -> TrajectoryStorage:
+    global _storage
+    _storage = TrajectoryStorage(**kwargs)
+    return _storage
+
+
+def get_trajectory_storage() -> TrajectoryStorage:
+    if _storage is None:
+        configure_trajectory_storage()
+    return _storage
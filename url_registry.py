@@ -0,0 +1,94 @@
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from tracing import annotate
+
+# only parameters that never select content: "ref" is left alone, it picks e.g. a GitHub branch.
+TRACKING_PARAM_PREFIXES = ("utm_",)
+TRACKING_PARAMS = frozenset(
+    {
+        "fbclid",
+        "gclid",
+        "dclid",
+        "msclkid",
+        "yclid",
+        "igshid",
+        "mc_cid",
+        "mc_eid",
+        "_hsenc",
+        "_hsmi",
+        "ref_src",
+    }
+)
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def canonicalize_url(url: str) -> str:
+    """Lower-case scheme and host, drop default ports, the fragment and tracking params, sort the query."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    try:
+        port = parts.port
+    except ValueError:
+        # a malformed port ("http://a.com:abc/", search results hold any text): the netloc is kept.
+        port, host = None, parts.netloc.lower()
+    if port and port != _DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{port}"
+    query = urlencode(
+        sorted(
+            (key, value)
+            for key, value in parse_qsl(parts.query, keep_blank_values=True)
+            if key.lower() not in TRACKING_PARAMS
+            and not key.lower().startswith(TRACKING_PARAM_PREFIXES)
+        )
+    )
+    return urlunsplit((scheme, host, parts.path or "/", query, ""))
+
+
+class URLRegistry:
+    """Run scoped registry: every distinct URL is scraped once, later requests share the first scrape."""
+
+    def __init__(self, canonicalize: bool = True):
+        self.canonicalize = canonicalize
+        self.requested = 0
+        self._scrapes: Dict[str, asyncio.Task] = {}
+
+    @property
+    def unique(self) -> int:
+        return len(self._scrapes)
+
+    def key(self, url: str) -> str:
+        return canonicalize_url(url) if self.canonicalize else url.strip()
+
+    async def fetch(self, url: str, scrape: Callable[[], Awaitable[Any]]) -> Any:
+        self.requested += 1
+        key = self.key(url)
+        task = self._scrapes.get(key)
+        annotate(registry_hit=task is not None)
+        if task is None:
+            task = asyncio.ensure_future(scrape())
+            self._scrapes[key] = task
+        return await asyncio.shield(task)
+
+
+current_url_registry: ContextVar[Optional[URLRegistry]] = ContextVar(
+    "current_url_registry", default=None
+)
+
+
+@contextmanager
+def url_registry_scope(canonicalize: bool = True) -> Iterator[URLRegistry]:
+    """Open a registry for the current run, or join the one of an enclosing run."""
+    registry = current_url_registry.get()
+    if registry is not None:
+        yield registry
+        return
+    registry = URLRegistry(canonicalize=canonicalize)
+    token = current_url_registry.set(registry)
+    try:
+        yield registry
+    finally:
+        current_url_registry.reset(token)
@@ -1,12 +1,21 @@
-from typing import List, Dict, get_args, get_origin, _GenericAlias
-from bs4 import BeautifulSoup
-from langchain.tools import tool
-from langchain_core.runnables.utils import Output
+from functools import lru_cache
+from typing import (
+    Any,
+    Callable,
+    Iterable,
+    List,
+    Dict,
+    Optional,
+    get_args,
+    get_origin,
+    _GenericAlias,
+)
 from tools_agents_selection import ToolResponse, AgentResponse
-from langchain_community.document_loaders.recursive_url_loader import RecursiveUrlLoader
 
 
 def custom_extractor(html_content):
+    from bs4 import BeautifulSoup
+
     soup = BeautifulSoup(html_content, "html.parser")
     return soup.get_text()
 
@@ -30,68 +39,142 @@ def create_context_for_agent(name: str, role: str, tool: str):
     return context
 
 
-def create_content_for_tools_executed_response(tools_executed_response_dict: dict):
-    content = """The following tools have generated following responses: \n\n
-    
-    
+class PromptBuffer:
+    """Text buffer collecting the parts of a prompt and joining them once.
+
+    With 'max_chars' the buffer is bounded: the part crossing the limit is cut and later parts are dropped.
     """
-    for idx, (tool_name, response) in enumerate(tools_executed_response_dict.items()):
-        tool_content = f"""
-        
-        Tool[{idx}]_NAME: {tool_name} 
-        Tool[{idx}]_RESPONSE: {response}
-        
-        
-        """
-        content = content + tool_content
 
-    return content
+    def __init__(self, max_chars: Optional[int] = None):
+        self.max_chars = max_chars
+        self.size = 0
+        self.truncated = False
+        self._parts: List[str] = []
+
+    def write(self, text: str) -> bool:
+        """Append 'text', False once the buffer is full."""
+        if self.max_chars is not None and self.size + len(text) > self.max_chars:
+            text = text[: self.max_chars - self.size]
+            self.truncated = True
+        self._parts.append(text)
+        self.size += len(text)
+        return not self.truncated
+
+    def getvalue(self) -> str:
+        return "".join(self._parts)
+
+
+def render_prompt(
+    header: str,
+    entry_template: str,
+    entries: Iterable[Dict[str, Any]],
+    max_chars: Optional[int] = None,
+    start: int = 1,
+) -> str:
+    """Render 'header' then 'entry_template' formatted with each entry, in one pass into a PromptBuffer.
+    'index' (counted from 'start') is available to the entry template.
+
+    With 'max_chars' the string values of an entry are cut to the remaining budget before formatting,
+    so an oversized response is never copied in full only to be truncated.
+    """
+    buffer = PromptBuffer(max_chars=max_chars)
+    if buffer.write(header):
+        for index, entry in enumerate(entries, start=start):
+            if max_chars is not None:
+                remaining = max_chars - buffer.size
+                entry = {
+                    key: value[:remaining] if isinstance(value, str) else value
+                    for key, value in entry.items()
+                }
+            if not buffer.write(entry_template.format(index=index, **entry)):
+                break
+    return buffer.getvalue()
+
+
+TOOLS_EXECUTED_HEADER = "The following tools have generated following responses:\n\n"
+TOOLS_EXECUTED_ENTRY = (
+    "Tool[{index}]_NAME: {name}\nTool[{index}]_RESPONSE: {response}\n\n"
+)
+TOOLS_OPERATION_HEADER = (
+    "The tools below have generated the corresonding responses after running:\n\n"
+)
+TOOLS_OPERATION_ENTRY = TOOLS_EXECUTED_ENTRY
+AGENTS_EXECUTION_HEADER = "The team agents below have generated the corresonding responses after execution:\n\n"
+AGENTS_EXECUTION_ENTRY = (
+    "AGENT[{index}]_NAME: {name}\nAGENT[{index}]_RESPONSE: {response}\n\n"
+)
+
+
+def create_content_for_tools_executed_response(
+    tools_executed_response_dict: dict, max_chars: Optional[int] = None
+):
+    return render_prompt(
+        TOOLS_EXECUTED_HEADER,
+        TOOLS_EXECUTED_ENTRY,
+        (
+            {"name": tool_name, "response": response}
+            for tool_name, response in tools_executed_response_dict.items()
+        ),
+        max_chars=max_chars,
+        # these tools were always numbered from 0, unlike the tool and agent responses.
+        start=0,
+    )
 
 
 def create_content_for_tools_operation_response(
     tools_operation_response: List[ToolResponse],
+    rendered_responses: Optional[List[str]] = None,
+    max_chars: Optional[int] = None,
 ) -> str:
+    """'rendered_responses' replaces the raw responses, e.g. the ones fitted by the prompt budgeter."""
 
     if len(tools_operation_response) <= 0:
         return "No tools were used to generate response !"
 
-    content = """The tools below have generated the corresonding responses after running:
-    
-    
-    """
-
-    for idx, (tool_response) in enumerate(tools_operation_response):
-        tool_content = f"""
-        
-        Tool[{idx + 1}]_NAME: {tool_response.tool.tool_name} 
-        Tool[{idx+1}]_RESPONSE: {tool_response.response}
-        
-        """
-        content = content + tool_content
-    return content
+    return render_prompt(
+        TOOLS_OPERATION_HEADER,
+        TOOLS_OPERATION_ENTRY,
+        (
+            {
+                "name": tool_response.tool.tool_name,
+                "response": (
+                    rendered_responses[idx]
+                    if rendered_responses is not None
+                    else tool_response.response
+                ),
+            }
+            for idx, tool_response in enumerate(tools_operation_response)
+        ),
+        max_chars=max_chars,
+    )
 
 
 def create_content_for_agents_execution_response(
     agents_execution_responses: List[AgentResponse],
+    rendered_responses: Optional[List[str]] = None,
+    max_chars: Optional[int] = None,
 ) -> str:
+    """'rendered_responses' replaces the raw responses, e.g. the ones fitted by the prompt budgeter."""
 
     if len(agents_execution_responses) <= 0:
         return "No agents were collaborated to generate response !"
 
-    content = """The team agents below have generated the corresonding responses after execution:
-    
-    
-    """
-
-    for idx, (agent_response) in enumerate(agents_execution_responses):
-        agent_content = f"""
-        
-        AGENT[{idx+1}]_NAME: {agent_response.agent.agent_name} 
-        AGENT[{idx+1}]_RESPONSE: {agent_response.response}
-        
-        """
-        content = content + agent_content
-    return content
+    return render_prompt(
+        AGENTS_EXECUTION_HEADER,
+        AGENTS_EXECUTION_ENTRY,
+        (
+            {
+                "name": agent_response.agent.agent_name,
+                "response": (
+                    rendered_responses[idx]
+                    if rendered_responses is not None
+                    else agent_response.response
+                ),
+            }
+            for idx, agent_response in enumerate(agents_execution_responses)
+        ),
+        max_chars=max_chars,
+    )
 
 
 def create_content_for_validate_tool_response(tool_name, tool_response):
@@ -143,6 +226,12 @@ def transform_schema_args_type(args):
     return output_schema
 
 
+@lru_cache(maxsize=None)
+def schema_args_type(function: Callable) -> dict:
+    """transform_schema_args_type of the function annotations, computed once and shared by every instance."""
+    return transform_schema_args_type(function.__annotations__.copy())
+
+
 if __name__ == "__main__":
     print("hello")
     # x = scrape_website_text_content.run(